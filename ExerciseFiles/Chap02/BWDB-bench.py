@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# BWDB-bench.py – benchmark BWDB CRUD and query paths
+#
+# usage: BWDB-bench.py [--rows N ...] [--repeat N] [--out results.json] [--compare old.json]
+#
+# Runs against a copy of ../db/world.db and a synthetic table of --rows rows
+# (default 10000, up to 10^7) in a temporary directory, and prints the results
+# as JSON so runs from different commits can be compared with --compare.
+# Benchmarks of methods an older BWDB doesn't have are skipped, and the bulk
+# load falls back to an add_row loop, so a baseline tree can be measured too.
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from BWDB import BWDB, BWErr
+
+WORLD_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'db', 'world.db')
+
+# keep the row-at-a-time loops and lookups bounded on the big tables
+LOOP_ROWS = 10000
+LOOKUPS = 10000
+DEEP_PAGES = 20
+PAGE_SIZE = 25
+
+
+def timed(results, dataset, name, n, func, repeat):
+    """ Run func repeat times and record the best time for n operations """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    results.append({
+        'dataset': dataset,
+        'name': name,
+        'n': n,
+        'seconds': round(best, 6),
+        'ops_per_sec': round(n / best, 1) if best else None,
+    })
+    print(f"  {name:<28} {n:>10} ops {best:>10.4f}s", file=sys.stderr)
+
+
+def refresh(db):
+    """ Reload the cached schema, on trees that cache it """
+    if hasattr(db, 'refresh_schema'):
+        db.refresh_schema()
+
+
+def bench_reads(db, dataset, results, repeat, find_col, find_value):
+    """ Read paths shared by world.db and the synthetic table """
+    count = db.count_rows()
+    ids = [(i * 7919) % count + 1 for i in range(min(LOOKUPS, count))]
+
+    def get_rows():
+        for row_id in ids:
+            db.get_row(row_id)
+
+    def find_rows():
+        db.find_rows(find_col, find_value)
+
+    offsets = [count - PAGE_SIZE * (i + 1) for i in range(DEEP_PAGES) if count > PAGE_SIZE * (i + 1)]
+
+    def limit_deep():
+        for offset in offsets:
+            list(db.get_rows_limit(PAGE_SIZE, offset))
+
+    def keyset_deep():
+        for offset in offsets:
+            db.get_rows_after(offset, PAGE_SIZE)
+
+    def count_rows():
+        for _ in range(100):
+            db.count_rows()
+
+    rows = list(db.get_rows_limit(min(LOOKUPS, count)))
+
+    def dict_rows():
+        for row in rows:
+            db.make_dict_row(row)
+
+    def bwrow_rows():
+        for row in rows:
+            db.make_row(row)
+
+    timed(results, dataset, 'get_row', len(ids), get_rows, repeat)
+    timed(results, dataset, 'find_rows_like', 1, find_rows, repeat)
+    timed(results, dataset, 'get_rows_limit_deep', len(offsets), limit_deep, repeat)
+    if hasattr(db, 'get_rows_after'):
+        timed(results, dataset, 'get_rows_after_deep', len(offsets), keyset_deep, repeat)
+    timed(results, dataset, 'count_rows', 100, count_rows, repeat)
+    timed(results, dataset, 'make_dict_row', len(rows), dict_rows, repeat)
+    if hasattr(db, 'make_row'):
+        timed(results, dataset, 'make_row', len(rows), bwrow_rows, repeat)
+
+
+def bench_world(tmpdir, results, repeat):
+    print("world.db", file=sys.stderr)
+    database = os.path.join(tmpdir, 'world.db')
+    shutil.copyfile(WORLD_DB, database)
+    db = BWDB(dbms='sqlite', database=database)
+    # BWDB wants a lowercase id column, City has ID
+    db.sql_do("""
+        CREATE TABLE city_bench (
+            id INTEGER PRIMARY KEY, name TEXT, countrycode TEXT, district TEXT, population INTEGER
+        )
+    """)
+    db.sql_do("INSERT INTO city_bench SELECT ID, Name, CountryCode, District, Population FROM City")
+    refresh(db)
+    db.table = 'city_bench'
+    bench_reads(db, 'world', results, repeat, 'name', '%ton%')
+    db.disconnect()
+
+
+def synthetic_rows(n, start=0):
+    for i in range(start, start + n):
+        yield (f"name {i:08d}", f"description of row {i}")
+
+
+def bench_synthetic(tmpdir, rows, results, repeat):
+    dataset = f"synthetic-{rows}"
+    print(dataset, file=sys.stderr)
+    database = os.path.join(tmpdir, f"{dataset}.db")
+    db = BWDB(dbms='sqlite', database=database)
+    create = "CREATE TABLE bench (id INTEGER PRIMARY KEY, name TEXT NOT NULL, description TEXT)"
+
+    def reset():
+        db.sql_do("DROP TABLE IF EXISTS bench")
+        db.sql_do(create)
+        refresh(db)
+        db.table = 'bench'
+
+    loop_rows = min(rows, LOOP_ROWS)
+
+    def add_row_loop():
+        reset()
+        for row in synthetic_rows(loop_rows):
+            db.add_row(row)
+
+    def add_rows_bulk():
+        reset()
+        db.add_rows(synthetic_rows(loop_rows))
+
+    def load():
+        if hasattr(db, 'add_rows'):
+            db.add_rows(synthetic_rows(rows))
+        else:
+            for row in synthetic_rows(rows):
+                db.add_row_nocommit(row)
+            db.commit()
+
+    timed(results, dataset, 'add_row_loop', loop_rows, add_row_loop, repeat)
+    if hasattr(db, 'add_rows'):
+        timed(results, dataset, 'add_rows_bulk', loop_rows, add_rows_bulk, repeat)
+
+    # the full table is loaded once, in bulk
+    reset()
+    timed(results, dataset, 'add_rows_load', rows, load, 1)
+    bench_reads(db, dataset, results, repeat, 'name', '%7%')
+    db.disconnect()
+
+
+def compare(old_path, report):
+    """ Print the speedup of each result against an earlier report """
+    with open(old_path) as fh:
+        old = json.load(fh)
+    old_results = {(r['dataset'], r['name']): r for r in old['results']}
+    print(f"{'dataset':<20} {'benchmark':<28} {'old s':>10} {'new s':>10} {'speedup':>8}", file=sys.stderr)
+    for r in report['results']:
+        o = old_results.get((r['dataset'], r['name']))
+        if o is None or not r['seconds']:
+            continue
+        print(f"{r['dataset']:<20} {r['name']:<28} {o['seconds']:>10.4f} {r['seconds']:>10.4f} "
+              f"{o['seconds'] / r['seconds']:>7.2f}x", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmark BWDB')
+    parser.add_argument('--rows', type=int, nargs='*', default=[10000],
+                        help='synthetic table sizes, 10^4 to 10^7 (default 10000)')
+    parser.add_argument('--repeat', type=int, default=3, help='best of N runs (default 3)')
+    parser.add_argument('--no-world', action='store_true', help='skip world.db')
+    parser.add_argument('--out', help='write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='earlier JSON report to compare against')
+    args = parser.parse_args()
+
+    report = {
+        'bwdb_version': BWDB.version(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': [],
+    }
+    tmpdir = tempfile.mkdtemp(prefix='bwdb-bench-')
+    try:
+        if not args.no_world:
+            bench_world(tmpdir, report['results'], args.repeat)
+        for rows in args.rows:
+            bench_synthetic(tmpdir, rows, report['results'], args.repeat)
+    except BWErr as err:
+        print(f"Error: {err}", file=sys.stderr)
+        exit(1)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, 'w') as fh:
+            json.dump(report, fh, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == "__main__":
+    main()
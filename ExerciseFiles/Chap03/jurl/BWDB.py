@@ -6,6 +6,26 @@
 # module version
 __version__ = "3.1.11"
 
+import asyncio
+import csv
+import gzip
+import json
+import os
+import re
+import sys
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict
+from urllib.request import pathname2url
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import partial
+from itertools import islice
+from operator import itemgetter
+
 # import sqlite3
 try:
     import sqlite3
@@ -22,6 +42,55 @@ except ImportError:
     mysql = None
     have_mysql = False
 
+# import numpy (optional, for fetch_columns)
+try:
+    import numpy
+    have_numpy = True
+except ImportError:
+    numpy = None
+    have_numpy = False
+
+# sqlite connection tuning, BWDB(profile=...)
+SQLITE_PROFILES = dict(
+    default=dict(),
+    # concurrent readers with the occasional writer (e.g. jurl under cgi)
+    read_heavy=dict(journal_mode='WAL', synchronous='NORMAL', mmap_size=268435456,
+                    cache_size=-65536, temp_store='MEMORY', busy_timeout=5000),
+    # fast loads, the database may be lost on power failure (not on app crash)
+    bulk_load=dict(journal_mode='WAL', synchronous='OFF', cache_size=-262144,
+                   temp_store='MEMORY', busy_timeout=5000, wal_autocheckpoint=10000),
+    # every commit is on disk before it returns
+    durable=dict(journal_mode='WAL', synchronous='FULL', busy_timeout=5000),
+)
+SQLITE_PRAGMA_ORDER = ('journal_mode', 'synchronous', 'mmap_size', 'cache_size',
+                       'temp_store', 'busy_timeout', 'wal_autocheckpoint')
+
+# generated statements that scan or insert by design, not audited
+AUDIT_SKIP = ('count', 'get_all', 'add', 'add_multi', 'upsert')
+
+# set-based methods: ids per IN list, and when to switch to a temp table join
+ID_CHUNK_SIZE = 500
+ID_TEMP_TABLE_THRESHOLD = 20000
+ID_TEMP_TABLE = 'bwdb_ids'
+
+# load_sql() multi-row INSERT cap, well under mysql's max_allowed_packet
+LOAD_BATCH_BYTES = 1 << 20
+
+# side table for enable_row_counter()
+ROW_COUNTER_TABLE = 'bwdb_rowcount'
+
+# copy_table() column types, first matching substring of the upper-cased source type wins
+# (types with a size, like VARCHAR(40) or DECIMAL(10,2), are valid in both and kept as-is)
+SQLITE_TO_MYSQL_TYPES = (('INT', 'BIGINT'), ('CHAR', 'TEXT'), ('CLOB', 'LONGTEXT'), ('TEXT', 'TEXT'),
+                         ('BLOB', 'LONGBLOB'), ('REAL', 'DOUBLE'), ('FLOA', 'DOUBLE'), ('DOUB', 'DOUBLE'),
+                         ('DATETIME', 'DATETIME'), ('TIMESTAMP', 'DATETIME'), ('DATE', 'DATE'),
+                         ('TIME', 'TIME'), ('BOOL', 'TINYINT(1)'), ('NUM', 'DECIMAL(65,30)'),
+                         ('DEC', 'DECIMAL(65,30)'),
+                         ('', 'TEXT'))
+MYSQL_TO_SQLITE_TYPES = (('INT', 'INTEGER'), ('SERIAL', 'INTEGER'), ('BOOL', 'INTEGER'), ('BIT', 'INTEGER'),
+                         ('DEC', 'NUMERIC'), ('NUMERIC', 'NUMERIC'), ('FLOAT', 'REAL'), ('DOUBLE', 'REAL'),
+                         ('REAL', 'REAL'), ('BLOB', 'BLOB'), ('BINARY', 'BLOB'), ('', 'TEXT'))
+
 
 class BWErr(Exception):
     """Simple Error class"""
@@ -31,7 +100,486 @@ class BWErr(Exception):
         super().__init__(self.message)
 
 
+class BWTimer:
+    """ Per-statement timing for BWDB: hooks, latency histograms and a slow-query log """
+    _literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+    _in_lists = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+    _spaces = re.compile(r"\s+")
+
+    def __init__(self, slow_ms=None, slow_log=None, hook=None):
+        self.slow_ms = slow_ms          # log statements slower than this
+        self.slow_log = slow_log        # file name or file object, default stderr
+        self.hooks = [hook] if hook else []     # called with a dict per statement
+        self.stats = {}                 # fingerprint -> dict(count, seconds, max, rows, histogram)
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        self._log_fh = None
+
+    @classmethod
+    def fingerprint(cls, sql):
+        """ Normalize SQL: literals to ?, IN lists collapsed, whitespace squeezed """
+        sql = cls._literals.sub('?', sql)
+        sql = cls._in_lists.sub('(?+)', sql)
+        return cls._spaces.sub(' ', sql).strip()
+
+    @staticmethod
+    def bucket(seconds):
+        """ Histogram bucket: log2 of microseconds """
+        return min(int(seconds * 1000000).bit_length(), 31)
+
+    @staticmethod
+    def caller():
+        """ file:line function of the first frame outside this module """
+        f = sys._getframe(1)
+        while f is not None and f.f_code.co_filename == __file__:
+            f = f.f_back
+        if f is None:
+            return None
+        return f"{f.f_code.co_filename}:{f.f_lineno} {f.f_code.co_name}"
+
+    def record(self, sql, seconds, rows, caller=None):
+        fp = self._fingerprints.get(sql)
+        if fp is None:
+            if len(self._fingerprints) > 10000:
+                self._fingerprints.clear()
+            fp = self._fingerprints[sql] = self.fingerprint(sql)
+        if caller is None:
+            caller = self.caller()
+        with self._lock:
+            st = self.stats.get(fp)
+            if st is None:
+                st = self.stats[fp] = dict(count=0, seconds=0.0, max=0.0, rows=0, histogram=[0] * 32)
+            st['count'] += 1
+            st['seconds'] += seconds
+            st['rows'] += max(rows, 0)
+            if seconds > st['max']:
+                st['max'] = seconds
+            st['histogram'][self.bucket(seconds)] += 1
+        if self.hooks:
+            event = dict(sql=sql, fingerprint=fp, seconds=seconds, rows=rows, caller=caller)
+            for hook in self.hooks:
+                hook(event)
+        if self.slow_ms is not None and seconds * 1000 >= self.slow_ms:
+            self._log_slow(fp, seconds, rows, caller)
+
+    def _log_slow(self, fp, seconds, rows, caller):
+        line = f"{time.strftime('%Y-%m-%d %H:%M:%S')} {seconds * 1000:.3f}ms rows={rows} [{caller}] {fp}\n"
+        with self._lock:
+            if self._log_fh is None:
+                if self.slow_log is None:
+                    self._log_fh = sys.stderr
+                elif isinstance(self.slow_log, str):
+                    self._log_fh = open(self.slow_log, 'a')
+                else:
+                    self._log_fh = self.slow_log
+            self._log_fh.write(line)
+            self._log_fh.flush()
+
+    def report(self):
+        """ List of (fingerprint, stats) sorted by total time """
+        with self._lock:
+            items = [(fp, dict(st, histogram=list(st['histogram']))) for fp, st in self.stats.items()]
+        return sorted(items, key=lambda i: i[1]['seconds'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+
+class BWAudit:
+    """ EXPLAIN QUERY PLAN auditor for the statements BWDB generates """
+    _where_cols = re.compile(r"\b(\w+)\)?\s*(=|<|>|LIKE)\s*\(?\?", re.IGNORECASE)
+    _order_cols = re.compile(r"ORDER BY ([\w, ]+?)(?: DESC)?(?: LIMIT|$)", re.IGNORECASE)
+
+    def __init__(self):
+        self.plans = {}     # sql -> dict(table, plan, problems)
+        self._lock = threading.Lock()
+
+    def check(self, db, sql, table):
+        """ Explain sql the first time it is seen """
+        with self._lock:
+            if sql in self.plans:
+                return
+            self.plans[sql] = None      # claimed, explained below
+        parms = (None,) * sql.count('?')
+        cur = db._new_cursor()
+        try:
+            if db.dbms == 'mysql':
+                cur.execute(f"EXPLAIN {sql}", parms)
+                names = [d[0].lower() for d in cur.description]
+                plan = [dict(zip(names, r)) for r in cur.fetchall()]
+                problems = [f"{p['table']}: full scan" for p in plan if p.get('type') == 'ALL']
+                problems += [f"{p['table']}: {p['extra']}" for p in plan
+                             if p.get('extra') and ('temporary' in p['extra'] or 'filesort' in p['extra'])]
+            else:
+                cur.execute(f"EXPLAIN QUERY PLAN {sql}", parms)
+                plan = [r[3] for r in cur.fetchall()]
+                # a scan that stops at LIMIT (no filter, no offset) is fine
+                bounded = ' LIMIT ' in sql and ' WHERE ' not in sql and ' OFFSET ' not in sql
+                problems = [d for d in plan if 'TEMP B-TREE' in d or
+                            (d.startswith('SCAN') and 'INDEX' not in d and not bounded)]
+        finally:
+            cur.close()
+        with self._lock:
+            self.plans[sql] = dict(table=table, plan=plan, problems=problems)
+
+    def report(self):
+        """ List of (sql, info) for statements with a scan or temp b-tree plan """
+        with self._lock:
+            return [(sql, info) for sql, info in self.plans.items() if info and info['problems']]
+
+    def suggestions(self):
+        """ Suggested indexes (or search indexes for LIKE) per table for the flagged statements """
+        suggest = {}
+        for sql, info in self.report():
+            table = info['table']
+            where = sql.split(' WHERE ', 1)[1] if ' WHERE ' in sql else ''
+            for col, op in self._where_cols.findall(where):
+                if col == 'id':
+                    continue
+                if op.upper() == 'LIKE':
+                    hint = f"db.enable_search('{col}')  # LIKE '%...%' can't use a b-tree index"
+                else:
+                    hint = f"CREATE INDEX {table}_{col} ON {table} ({col})"
+                suggest.setdefault(table, set()).add(hint)
+            for order in self._order_cols.findall(sql):
+                cols = [c.strip() for c in order.split(',') if c.strip() != 'id']
+                if cols:
+                    hint = f"CREATE INDEX {table}_{'_'.join(cols)} ON {table} ({', '.join(cols)})"
+                    suggest.setdefault(table, set()).add(hint)
+        return {table: sorted(hints) for table, hints in suggest.items()}
+
+    def print_report(self, file=None):
+        for sql, info in self.report():
+            print(f"{sql}", file=file)
+            for problem in info['problems']:
+                print(f"    {problem}", file=file)
+        for table, hints in self.suggestions().items():
+            print(f"suggestions for {table}:", file=file)
+            for hint in hints:
+                print(f"    {hint}", file=file)
+
+
+class BWCache:
+    """ LRU/TTL query result cache for BWDB, invalidated by table on writes """
+    _table_name = r"(?:[`\"]?\w+[`\"]?\.)?[`\"]?(\w+)[`\"]?"    # schema prefix and quotes dropped
+    _from = re.compile(r"\b(?:FROM|JOIN)\s+", re.IGNORECASE)
+    _from_item = re.compile(r"\s*" + _table_name + r"(?:\s+(?:AS\s+)?\w+)?\s*(,)?", re.IGNORECASE)
+    _write_table = re.compile(r"^\s*(?:(?:INSERT|REPLACE)(?:\s+OR\s+\w+)?(?:\s+IGNORE)?\s+INTO"
+                              r"|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+" + _table_name, re.IGNORECASE)
+    _no_change = ('SELECT', 'BEGIN', 'SAVEPOINT', 'RELEASE', 'COMMIT', 'START', 'EXPLAIN')
+    MISS = object()
+
+    def __init__(self, size=1000, ttl=60, max_rows=1000):
+        self.size = size            # entries
+        self.ttl = ttl              # seconds, None for no expiry
+        self.max_rows = max_rows    # bigger results are streamed, not cached
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()   # key -> (value, expires, tables)
+        self._by_table = {}             # table -> set of keys
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(kind, sql, parms):
+        if sql.lstrip()[:6].upper() != 'SELECT':     # PRAGMA and friends are never cached
+            return None
+        try:
+            key = (kind, sql, tuple(parms))
+            hash(key)
+        except TypeError:   # unhashable parms, don't cache
+            return None
+        return key
+
+    def check_version(self, db):
+        """ Drop everything if another connection committed to the sqlite database """
+        if db.dbms != 'sqlite':
+            return
+        # data_version is per connection, so BWDB keeps the last value (per thread if thread_local)
+        version = db.connection.execute("PRAGMA data_version").fetchone()[0]
+        if version != db._data_version:
+            self.clear()
+            db._data_version = version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return self.MISS
+            value, expires, tables = entry
+            if expires is not None and expires < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return self.MISS
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    @classmethod
+    def read_tables(cls, sql):
+        """ Tables a SELECT reads (FROM a, b and JOINs), None if they can't be told for sure """
+        tables = []
+        for m in cls._from.finditer(sql):
+            pos = m.end()
+            while True:
+                item = cls._from_item.match(sql, pos)
+                if item is None:    # a subquery or something else we can't parse
+                    return None
+                tables.append(item.group(1).lower())
+                if item.group(2) is None:
+                    break
+                pos = item.end()
+        return tuple(tables) or None
+
+    def put(self, key, value, sql):
+        tables = self.read_tables(sql)
+        if tables is None:      # couldn't be invalidated, don't cache
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires, tables)
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            while len(self._entries) > self.size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        value, expires, tables = self._entries.pop(key)
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+
+    def invalidate_sql(self, sql):
+        """ Called after every write statement """
+        word = sql.lstrip()[:9].upper()
+        if word.startswith(self._no_change):
+            return
+        m = self._write_table.match(sql)
+        if m is None:   # DDL or something we can't parse
+            self.clear()
+            return
+        table = m.group(1).lower()
+        # triggers write the row counter and search index tables too
+        self.invalidate(table, ROW_COUNTER_TABLE, f"{table}_fts")
+
+    def invalidate(self, *tables):
+        with self._lock:
+            for table in tables:
+                keys = self._by_table.pop(table.lower(), ())
+                for key in keys:
+                    if key in self._entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._by_table = {}
+
+    def stats(self):
+        with self._lock:
+            return dict(entries=len(self._entries), hits=self.hits, misses=self.misses,
+                        evictions=self.evictions, invalidations=self.invalidations)
+
+
+class BWRow(tuple):
+    """ Base for generated row classes: a tuple with attribute and mapping access """
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return tuple(zip(self._fields, self))
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        if index is None:
+            return default
+        return tuple.__getitem__(self, index)
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+
+_row_classes = {}
+
+
+def make_row_class(names):
+    """ Return a BWRow subclass for a sequence of column names (cached) """
+    names = tuple(names)
+    cls = _row_classes.get(names)
+    if cls is None:
+        attrs = dict(__slots__=(), _fields=names, _index={n: i for i, n in enumerate(names)})
+        for i, n in enumerate(names):
+            if not hasattr(BWRow, n):   # don't shadow keys(), get(), count() ...
+                attrs[n] = property(itemgetter(i))
+        cls = _row_classes.setdefault(names, type('Row', (BWRow,), attrs))
+    return cls
+
+
+class BWSchema:
+    """ Process-wide cache of table metadata, one per database """
+    _catalogs = {}
+    _catalogs_lock = threading.Lock()
+
+    def __init__(self, dbms):
+        self.dbms = dbms
+        self.version = None     # sqlite PRAGMA schema_version when loaded
+        self.tables = {}        # lowercase name -> table info dict
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_db(cls, db):
+        """ Return the shared catalog for a BWDB's database, loading or refreshing as needed """
+        key = cls.make_key(db)
+        if key is None:
+            # private to the connection: kept on the BWDB and dropped with the connection
+            catalog = db._catalog
+            if catalog is None:
+                catalog = db._catalog = cls(db.dbms)
+        else:
+            with cls._catalogs_lock:
+                catalog = cls._catalogs.get(key)
+                if catalog is None:
+                    catalog = cls(db.dbms)
+                    cls._catalogs[key] = catalog
+        catalog.validate(db)
+        return catalog
+
+    @staticmethod
+    def make_key(db):
+        """ Key for the shared catalog, None for databases private to one connection """
+        database = db.database
+        if db.dbms == 'sqlite':
+            if database in (':memory:', '') or str(database).startswith('file:') or db._in_memory:
+                return None
+            return db.dbms, os.path.abspath(database), None
+        return db.dbms, database, db.host
+
+    def validate(self, db):
+        """ Reload if the sqlite schema_version changed (mysql only loads once, see refresh) """
+        with self._lock:
+            if self.dbms == 'sqlite':
+                version = db.sql_query_value("PRAGMA schema_version")
+                if version != self.version:
+                    self._load(db)
+                    self.version = version
+            elif self.version is None:
+                self._load(db)
+                self.version = 0
+
+    @classmethod
+    def invalidate(cls, db):
+        """ Make a BWDB's catalog reload on its next use """
+        key = cls.make_key(db)
+        catalog = db._catalog if key is None else cls._catalogs.get(key)
+        if catalog is not None:
+            catalog.version = None
+
+    def refresh(self, db):
+        with self._lock:
+            self.version = None
+        self.validate(db)
+
+    def table(self, name):
+        """ Table info dict or None """
+        return self.tables.get(name.lower())
+
+    @staticmethod
+    def _table_info(name, columns, types, notnull, defaults, primary_key, indexes):
+        return dict(name=name, columns=tuple(columns), types=tuple(types), notnull=tuple(notnull),
+                    defaults=tuple(defaults), primary_key=tuple(primary_key), indexes=indexes)
+
+    @staticmethod
+    def _mysql_default(default, extra):
+        """ information_schema column_default as SQL text, like sqlite's dflt_value """
+        if default is None:
+            return None
+        if 'DEFAULT_GENERATED' in (extra or '').upper():    # an expression
+            return default
+        if re.fullmatch(r"-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?", default):
+            return default
+        return "'" + default.replace("'", "''") + "'"
+
+    def _load(self, db):
+        tables = {}
+        if self.dbms == 'sqlite':
+            names = [r[0] for r in db.sql_query("SELECT name FROM sqlite_master "
+                                                "WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'")]
+            for name in names:
+                cols = list(db.sql_query(f"PRAGMA table_info ('{name}')"))
+                pk = [r[1] for r in sorted((r for r in cols if r[5]), key=lambda r: r[5])]
+                indexes = {}
+                for idx in list(db.sql_query(f"PRAGMA index_list ('{name}')")):
+                    idx_cols = tuple(r[2] for r in db.sql_query(f"PRAGMA index_info ('{idx[1]}')"))
+                    indexes[idx[1]] = dict(unique=bool(idx[2]), columns=idx_cols)
+                tables[name.lower()] = self._table_info(name, (r[1] for r in cols), (r[2] for r in cols),
+                                                        (bool(r[3]) for r in cols), (r[4] for r in cols),
+                                                        pk, indexes)
+        elif self.dbms == 'mysql':
+            cols = {}
+            for tname, cname, ctype, nullable, default, extra in db.sql_query(
+                    "SELECT table_name, column_name, column_type, is_nullable, column_default, extra "
+                    "FROM information_schema.columns "
+                    "WHERE table_schema = DATABASE() ORDER BY table_name, ordinal_position"):
+                cols.setdefault(tname, []).append((cname, ctype, nullable == 'NO',
+                                                   self._mysql_default(default, extra)))
+            stats = {}
+            for tname, iname, non_unique, cname in db.sql_query(
+                    "SELECT table_name, index_name, non_unique, column_name FROM information_schema.statistics "
+                    "WHERE table_schema = DATABASE() ORDER BY table_name, index_name, seq_in_index"):
+                index = stats.setdefault(tname, {}).setdefault(iname, dict(unique=not non_unique, columns=()))
+                index['columns'] += (cname,)
+            for tname, tcols in cols.items():
+                indexes = stats.get(tname, {})
+                pk = indexes.get('PRIMARY', {}).get('columns', ())
+                tables[tname.lower()] = self._table_info(tname, (c[0] for c in tcols), (c[1] for c in tcols),
+                                                         (c[2] for c in tcols), (c[3] for c in tcols),
+                                                         pk, indexes)
+        else:
+            raise BWErr("BWSchema: unknown dbms")
+        self.tables = tables
+
+
 class BWDB:
+    # load_sql() statement handling
+    _sql_special = re.compile(r"['\"`;]|--|/\*")
+    _load_skip = re.compile(r"(?:(?:BEGIN|COMMIT|END|ROLLBACK)(?:\s+TRANSACTION|\s+WORK)?|START\s+TRANSACTION"
+                            r"|USE\s+\S+|CREATE\s+DATABASE\s.*|(?:UN)?LOCK\s+TABLES\b.*)\s*$",
+                            re.IGNORECASE | re.DOTALL)
+    _load_trigger = re.compile(r"CREATE\s+(?:TEMP(?:ORARY)?\s+)?TRIGGER\b", re.IGNORECASE)
+    _load_index = re.compile(r"CREATE\s+INDEX\b", re.IGNORECASE)     # not UNIQUE, that can fail
+    _load_insert = re.compile(r"(INSERT\s+(?:OR\s+\w+\s+|IGNORE\s+)?INTO\s+[\w`\".]+\s*(?:\([^)]*\))?)"
+                              r"\s*VALUES\s*(.*)", re.IGNORECASE | re.DOTALL)
+
+    def __new__(cls, **kwargs):
+        # BWDB(thread_local=True) gives each thread its own connection, see ThreadLocalBWDB
+        if cls is BWDB and kwargs.get('thread_local'):
+            cls = ThreadLocalBWDB
+        return super().__new__(cls)
+
     def __init__(self, **kwargs):
         self._db = None
         self._cur = None
@@ -39,6 +587,24 @@ class BWDB:
         self._database = None
         self._table = None
         self._column_names = None
+        self._statements = {}
+        self._catalog = None                # BWSchema of a private database, see BWSchema.for_db()
+        self._pool_key = None
+        self._dict_rows = False
+        self._timer = kwargs.get('timer')    # BWTimer, see enable_timing()
+        self._audit = kwargs.get('audit')    # BWAudit, see enable_audit()
+        self._cache = None                  # BWCache, see enable_cache()
+        self._read_db = None                # read-only connection, see _connect_reader()
+        self._read_cur = None
+        self._tx_depth = 0                  # nesting of transaction() blocks
+        self._group = None                  # (every, seconds) with group_commit()
+        self._pending = 0                   # commits held back by group_commit()
+        self._pending_since = 0
+        self._dirty = False                 # written since the last commit() while grouping
+        self._group_timer = None            # flushes after ms, see group_commit()
+        self._group_lock = threading.RLock()
+        self._data_version = None           # last PRAGMA data_version seen by the cache
+        self.arraysize = kwargs.get('arraysize', 500)    # rows per fetchmany in sql_query
 
         # populate simple parameters first
         if 'user' in kwargs:
@@ -56,12 +622,46 @@ class BWDB:
         else:
             self._host = None
 
+        # sqlite connections handed between threads (e.g. by BWDBPool) need this False
+        self._check_same_thread = kwargs.get('check_same_thread', True)
+
+        # sqlite tuning profile, a name from SQLITE_PROFILES or a dict of pragmas
+        self._profile = kwargs.get('profile', 'default')
+        if isinstance(self._profile, str) and self._profile not in SQLITE_PROFILES:
+            raise BWErr(f"unknown profile {self._profile}")
+
+        # read-only connection for queries: sqlite read_only=True (or immutable=True
+        # for files that never change), mysql replica_host='...'
+        self._read_only = kwargs.get('read_only', False)
+        self._immutable = kwargs.get('immutable', False)
+        self._replica_host = kwargs.get('replica_host')
+
+        # sqlite snapshot: copy the file into :memory: at open and serve everything from there,
+        # refresh_interval (seconds) reloads from the file, write_back saves on disconnect
+        self._in_memory = kwargs.get('in_memory', False)
+        self._refresh_interval = kwargs.get('refresh_interval')
+        self._write_back = kwargs.get('write_back', False)
+        self._snapshot_time = None
+        if self._in_memory and (self._read_only or self._immutable):
+            raise BWErr('in_memory: can not be combined with read_only/immutable')
+        if (self._refresh_interval is not None or self._write_back) and not self._in_memory:
+            raise BWErr('refresh_interval/write_back: need in_memory=True')
+        if self._refresh_interval is not None and self._write_back:
+            # a refresh would throw away the writes that write_back is meant to keep
+            raise BWErr('in_memory: refresh_interval can not be combined with write_back')
+
         # populate properties
         if 'dbms' in kwargs:
             self.dbms = kwargs['dbms']
 
+        if kwargs.get('cache'):
+            self.enable_cache(**kwargs.get('cache_options', {}))
+
         if 'database' in kwargs:
-            self.database = kwargs['database']
+            if 'connection' in kwargs:
+                self.attach(kwargs['connection'], kwargs['database'])
+            else:
+                self.database = kwargs['database']
 
         if 'table' in kwargs:
             self.table = kwargs['table']
@@ -89,33 +689,221 @@ class BWDB:
 
     def set_database(self, database):
         self._database = database
+        self._column_names = None
+        self._statements = {}
+        self._catalog = None
+        self._close_reader()
         if self._cur:
             self._cur.close()
         if self._db:
             self._db.close()
 
         self._database = database
+        self._db = self._connect()
+        self._data_version = None
+        self._connect_reader()
+        self._set_row_factory()
+        self._cur = self._new_cursor()
+
+    def _connect(self):
+        """ Open a new connection to the current database """
         if self._dbms == 'sqlite':
-            self._db = sqlite3.connect(self._database)
-            if self._db is None:
-                raise BWErr('set_database: failed to open sqlite database')
+            if self._in_memory:
+                db = sqlite3.connect(':memory:', check_same_thread=self._check_same_thread)
+                self._copy_snapshot(db)
             else:
-                self._cur = self._db.cursor()
+                db = sqlite3.connect(self._database, check_same_thread=self._check_same_thread)
+            if db is None:
+                raise BWErr('set_database: failed to open sqlite database')
+            self._apply_profile(db)
         elif self._dbms == 'mysql':
-            self._db = mysql.connect(user=self._user, password=self._password,
-                                     host=self._host, database=self._database)
-            if self._db is None:
+            db = mysql.connect(user=self._user, password=self._password,
+                               host=self._host, database=self._database)
+            if db is None:
                 raise BWErr('set_database: failed to connect to mysql')
-            else:
-                self._cur = self._db.cursor(prepared=True)
         else:
             raise BWErr('set_database: unknown _dbms')
+        return db
+
+    # in-memory snapshot =====
+    def _copy_snapshot(self, db):
+        """ Copy the database file into db with the backup api """
+        if self._database in (':memory:', '') or str(self._database).startswith('file:'):
+            raise BWErr('in_memory: needs a database file name')
+        # read-only uri, so a missing file is an error instead of a new empty database
+        uri = f"file:{pathname2url(os.path.abspath(self._database))}?mode=ro"
+        try:
+            source = sqlite3.connect(uri, uri=True)
+        except sqlite3.OperationalError as err:
+            raise BWErr(f"in_memory: can not open {self._database}: {err}")
+        try:
+            source.backup(db)
+        finally:
+            source.close()
+        self._snapshot_time = time.monotonic()
+
+    def refresh_snapshot(self):
+        """ Reload the in-memory copy from the file, local unsaved changes are lost """
+        if not self._in_memory:
+            raise BWErr('refresh_snapshot: not an in_memory database')
+        if self._db.in_transaction or self._tx_depth:
+            raise BWErr('refresh_snapshot: transaction in progress')
+        self._copy_snapshot(self._db)
+        # the file's schema_version says nothing about this copy; this may run in the
+        # middle of a catalog load (lazy refresh from _reader), so only mark it stale
+        BWSchema.invalidate(self)
+        self._column_names = None
+        self._statements = {}
+        if self._cache is not None:
+            self._cache.clear()
+
+    def save_snapshot(self):
+        """ Write the in-memory copy back to the file """
+        if not self._in_memory:
+            raise BWErr('save_snapshot: not an in_memory database')
+        self.flush()
+        if self._db.in_transaction:
+            self._db.commit()
+        dest = sqlite3.connect(self._database)
+        try:
+            self._db.backup(dest)
+        finally:
+            dest.close()
+
+    def _connect_reader(self):
+        """ Open the read-only connection, if one was asked for """
+        if self._dbms == 'sqlite' and (self._read_only or self._immutable):
+            if self._database in (':memory:', '') or str(self._database).startswith('file:'):
+                raise BWErr('read_only: needs a database file name')
+            mode = 'immutable=1' if self._immutable else 'mode=ro'
+            uri = f"file:{pathname2url(os.path.abspath(self._database))}?{mode}"
+            self._read_db = sqlite3.connect(uri, uri=True, check_same_thread=self._check_same_thread)
+            self._apply_profile(self._read_db, read_only=True)
+        elif self._dbms == 'mysql' and self._replica_host:
+            self._read_db = mysql.connect(user=self._user, password=self._password,
+                                          host=self._replica_host, database=self._database)
+        else:
+            return
+        self._read_cur = self._new_cursor(self._read_db)
+
+    def _close_reader(self):
+        if self._read_cur is not None:
+            self._read_cur.close()
+        if self._read_db is not None:
+            self._read_db.close()
+        self._read_cur = None
+        self._read_db = None
+
+    def _reader(self):
+        """ Connection for reads: the replica, unless a transaction is open on the primary """
+        if self._refresh_interval is not None and self._db is not None and \
+                time.monotonic() - self._snapshot_time > self._refresh_interval and \
+                not (self._db.in_transaction or self._tx_depth or self._pending):
+            self.refresh_snapshot()
+        if self._read_db is None or self._tx_depth or self._pending or self._db.in_transaction:
+            return self._db
+        return self._read_db
+
+    def _apply_profile(self, db, read_only=False):
+        pragmas = self._profile
+        if isinstance(pragmas, str):
+            pragmas = SQLITE_PROFILES[pragmas]
+        for name in SQLITE_PRAGMA_ORDER:
+            if read_only and name in ('journal_mode', 'wal_autocheckpoint'):
+                continue
+            if name in pragmas:
+                db.execute(f"PRAGMA {name} = {pragmas[name]}").fetchall()
+        for name in pragmas:
+            if name not in SQLITE_PRAGMA_ORDER:
+                raise BWErr(f"profile: unsupported pragma {name}")
+
+    def checkpoint(self, mode='PASSIVE'):
+        """ Run a WAL checkpoint, returns (busy, wal frames, checkpointed frames) """
+        if self._dbms != 'sqlite':
+            return None
+        mode = mode.upper()
+        if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+            raise BWErr(f"checkpoint: invalid mode {mode}")
+        return tuple(self.sql_query_row(f"PRAGMA wal_checkpoint({mode})"))
+
+    def _new_cursor(self, db=None):
+        if db is None:
+            db = self._db
+        if self._dbms == 'mysql':
+            return db.cursor(prepared=True)
+        else:
+            return db.cursor()
+
+    def attach(self, connection, database):
+        """ Use an already open connection (e.g. from a BWDBPool) """
+        self.disconnect()
+        self._database = database
+        self._catalog = None
+        self._db = connection
+        self._data_version = None
+        self._connect_reader()
+        self._set_row_factory()
+        self._cur = self._new_cursor()
+
+    def detach(self):
+        """ Release the connection without closing it, returns the connection """
+        self.flush()
+        self._close_reader()
+        db = self._db
+        if self.have_cursor():
+            self._cur.close()
+        if self._dict_rows and self._dbms == 'sqlite' and db is not None:
+            db.row_factory = None   # don't hand a shaped connection back to a pool
+        self._cur = None
+        self._db = None
+        self._column_names = None
+        self._statements = {}
+        self._catalog = None
+        return db
 
     def get_cursor(self):
         return self._cur
 
+    def get_dict_rows(self):
+        return self._dict_rows
+
+    def set_dict_rows(self, flag):
+        """ True to return rows as generated BWRow classes (attribute and mapping access) """
+        self._dict_rows = bool(flag)
+        self._set_row_factory()
+
+    def _set_row_factory(self):
+        self._shape_connections(self._db, self._cur, self._read_db, self._read_cur)
+
+    def _shape_connections(self, *conns):
+        if self._dbms == 'sqlite':
+            # cursors copy row_factory when created, so set the open ones too
+            for conn in conns:
+                if conn is not None:
+                    conn.row_factory = self._row_factory() if self._dict_rows else None
+
+    @staticmethod
+    def _row_factory():
+        last = [None, None]     # description, row class
+
+        def row_factory(cursor, row):
+            description = cursor.description
+            if description is not last[0]:
+                last[0] = description
+                last[1] = make_row_class(d[0] for d in description)
+            return last[1](row)
+        return row_factory
+
+    def get_connection(self):
+        return self._db
+
+    def get_host(self):
+        return self._host
+
     def set_table(self, table):
         self._table = self.sanitize_string(table)
+        self._column_names = None
+        self._statements = {}
         self.column_names()
 
     def get_table(self):
@@ -126,39 +914,302 @@ class BWDB:
     database = property(fget=get_database, fset=set_database)
     table = property(fget=get_table, fset=set_table)
     cursor = property(fget=get_cursor)
+    dict_rows = property(fget=get_dict_rows, fset=set_dict_rows)
+    connection = property(fget=get_connection)
+    host = property(fget=get_host)
+
+    # instrumentation =====
+    def enable_timing(self, timer=None, **kwargs):
+        """ Time every statement, kwargs go to BWTimer (slow_ms, slow_log, hook) """
+        self._timer = timer if timer is not None else BWTimer(**kwargs)
+        return self._timer
+
+    def disable_timing(self):
+        self._timer = None
+
+    def get_timer(self):
+        return self._timer
+
+    timer = property(fget=get_timer)
+
+    # result cache =====
+    def enable_cache(self, size=1000, ttl=60, max_rows=1000):
+        """ Cache query results by (sql, parms), returns the BWCache (see BWCache.stats) """
+        self._cache = BWCache(size, ttl, max_rows)
+        return self._cache
+
+    def disable_cache(self):
+        self._cache = None
+
+    def get_cache(self):
+        return self._cache
+
+    cache = property(fget=get_cache)
+
+    def _execute(self, cur, sql, parms, many=False):
+        if self._group is not None and not self._dirty:
+            with self._group_lock:      # waits out a timer commit in progress
+                self._dirty = True
+        if self._cache is not None:
+            self._cache.invalidate_sql(sql)
+        timer = self._timer
+        if timer is None:
+            if many:
+                cur.executemany(sql, parms)
+            else:
+                cur.execute(sql, parms)
+            return
+        start = time.perf_counter()
+        if many:
+            cur.executemany(sql, parms)
+        else:
+            cur.execute(sql, parms)
+        timer.record(sql, time.perf_counter() - start, cur.rowcount)
+
+    def _execute_plain(self, sql):
+        """ Run a literal statement, on mysql with a plain cursor (triggers, savepoints,
+            dump statements can't be prepared), returns rowcount """
+        if self._dbms == 'mysql':
+            cur = self._db.cursor()
+            try:
+                self._execute(cur, sql, ())
+                return cur.rowcount
+            finally:
+                cur.close()
+        self._execute(self._cur, sql, ())
+        return self._cur.rowcount
 
     # sql methods =====
     def sql_do_nocommit(self, sql, parms=()):
         """Execute an SQL statement"""
-        self._cur.execute(sql, parms)
+        self._execute(self._cur, sql, parms)
         return self._cur.rowcount
 
     def sql_do(self, sql, parms=()):
         """Execute an SQL statement"""
-        self._cur.execute(sql, parms)
+        self._execute(self._cur, sql, parms)
         self.commit()
         return self._cur.rowcount
 
     def sql_do_many_nocommit(self, sql, parms=()):
         """Execute an SQL statement over set of data"""
-        self._cur.executemany(sql, parms)
+        self._execute(self._cur, sql, parms, many=True)
         return self._cur.rowcount
 
     def sql_do_many(self, sql, parms=()):
         """Execute an SQL statement over set of data"""
-        self._cur.executemany(sql, parms)
+        self._execute(self._cur, sql, parms, many=True)
         self.commit()
         return self._cur.rowcount
 
-    def sql_query(self, sql, parms=()):
-        self._cur.execute(sql, parms)
-        for row in self._cur:
-            yield row
+    def sql_query_batches(self, sql, parms=(), arraysize=None):
+        """ Yield lists of rows, fetched with fetchmany on a dedicated cursor """
+        if arraysize is None:
+            arraysize = self.arraysize
+        if self._cache is not None:
+            return self._cached_batches(sql, parms, arraysize)
+        return self._query_batches(sql, parms, arraysize)
+
+    def _cached_batches(self, sql, parms, arraysize):
+        cache = self._cache
+        cache.check_version(self)
+        key = cache.key('query', sql, parms)
+        if key is not None:
+            rows = cache.get(key)
+            if rows is not cache.MISS:
+                for i in range(0, len(rows), arraysize):
+                    yield rows[i:i + arraysize]
+                return
+        collected = [] if key is not None else None
+        for rows in self._query_batches(sql, parms, arraysize):
+            if collected is not None:
+                collected.extend(rows)
+                if len(collected) > cache.max_rows:
+                    collected = None    # too big, just stream it
+            yield rows
+        if collected is not None:
+            cache.put(key, collected, sql)
+
+    def _query_batches(self, sql, parms, arraysize):
+        # own cursor so nested queries don't clobber each other
+        # (mysql cursors are unbuffered, so consume or close before the next statement)
+        reader = self._reader()
+        timer = self._timer
+        elapsed = None
+        if timer is not None:
+            caller = timer.caller()
+            count = 0
+            start = time.perf_counter()
+        cur = self._new_cursor(reader)
+        try:
+            cur.execute(sql, parms)
+            if timer is not None:
+                elapsed = time.perf_counter() - start
+            row_class = None
+            if self._dict_rows and self._dbms == 'mysql':
+                row_class = make_row_class(cur.column_names)
+            while True:
+                if timer is None:
+                    rows = cur.fetchmany(arraysize)
+                else:   # only count driver time, not the consumer's
+                    start = time.perf_counter()
+                    rows = cur.fetchmany(arraysize)
+                    elapsed += time.perf_counter() - start
+                    count += len(rows)
+                if not rows:
+                    break
+                if row_class is not None:
+                    rows = [row_class(r) for r in rows]
+                yield rows
+        finally:
+            cur.close()
+            if elapsed is not None:
+                timer.record(sql, elapsed, count, caller)
+
+    def sql_query(self, sql, parms=(), arraysize=None):
+        for rows in self.sql_query_batches(sql, parms, arraysize):
+            yield from rows
+
+    def fetch_columns(self, sql, parms=(), dtypes=None, arraysize=None, use_numpy=None):
+        """
+            Fetch a query into typed column buffers, returns (columns, nulls)
+            columns maps name -> array.array (numpy array if use_numpy) or list for
+            non-numeric columns, nulls maps name -> array('B') mask (1 where NULL).
+            dtypes maps name -> array typecode; missing names are inferred from the
+            first non-NULL value (int -> 'q', float -> 'd', anything else -> list).
+            Values that don't fit an inferred buffer are kept as they are from then on,
+            and at the end the column becomes 'd' if they are all numbers, otherwise a list
+            of the raw values, so the result doesn't depend on arraysize.
+        """
+        if arraysize is None:
+            arraysize = self.arraysize
+        if use_numpy is None:
+            use_numpy = have_numpy
+        elif use_numpy and not have_numpy:
+            raise BWErr("fetch_columns: numpy not available")
+        dtypes = dict(dtypes or {})
+
+        timer = self._timer
+        if timer is not None:
+            start = time.perf_counter()
+        cur = self._new_cursor(self._reader())
+        try:
+            cur.execute(sql, parms)
+            names = [d[0] for d in cur.description]
+            columns = [None] * len(names)   # None until the first non-NULL value
+            tails = [None] * len(names)     # raw values after an inferred buffer overflowed
+            nulls = [array('B') for _ in names]
+            while True:
+                rows = cur.fetchmany(arraysize)
+                if not rows:
+                    break
+                values = list(zip(*rows))   # transpose the batch
+                for i, (mask, col) in enumerate(zip(nulls, values)):
+                    size = len(mask)
+                    has_null = None in col
+                    if has_null:
+                        mask.extend(v is None for v in col)
+                    else:
+                        mask.extend(bytes(len(col)))
+                    if tails[i] is not None:
+                        tails[i].extend(col)
+                        continue
+                    buf = columns[i]
+                    if buf is None:
+                        buf = self._column_buffer(dtypes.get(names[i]), col)
+                        if buf is None:     # all NULL so far
+                            continue
+                        buf.extend([0 if isinstance(buf, array) else None] * size)
+                        columns[i] = buf
+                    if not isinstance(buf, array):
+                        buf.extend(col)
+                        continue
+                    if has_null:
+                        zero = 0.0 if buf.typecode == 'd' else 0
+                        col = [zero if v is None else v for v in col]
+                    inferred = names[i] not in dtypes
+                    try:
+                        # a 'd' buffer would take ints and Decimals too, losing what they were
+                        if inferred and buf.typecode == 'd' and any(type(v) is not float for v in col):
+                            raise TypeError
+                        buf.extend(col)
+                    except (TypeError, OverflowError):
+                        if not inferred:
+                            raise
+                        del buf[size:]      # a failed extend leaves part of the batch behind
+                        tails[i] = list(values[i])
+        finally:
+            cur.close()
+        if timer is not None:
+            timer.record(sql, time.perf_counter() - start, len(nulls[0]) if nulls else 0)
+
+        for i, name in enumerate(names):
+            if columns[i] is None:      # no rows, or only NULLs
+                typecode = dtypes.get(name)
+                columns[i] = [None] * len(nulls[i]) if typecode is None else array(typecode, [0]) * len(nulls[i])
+            elif tails[i] is not None:
+                columns[i] = self._widen_buffer(columns[i], nulls[i], tails[i])
+        if use_numpy:
+            columns = [numpy.frombuffer(buf, dtype=buf.typecode) if isinstance(buf, array)
+                       else numpy.array(buf, dtype=object) for buf in columns]
+            nulls = [numpy.frombuffer(mask, dtype=bool) for mask in nulls]
+        return dict(zip(names, columns)), dict(zip(names, nulls))
+
+    @staticmethod
+    def _column_buffer(typecode, sample):
+        """ array for typecode or sample's first non-NULL value, [] for non-numbers, None if all NULL """
+        if typecode is None:
+            for v in sample:
+                if v is None:
+                    continue
+                if isinstance(v, int):
+                    typecode = 'q'
+                elif isinstance(v, (float, Decimal)):
+                    typecode = 'd'
+                else:
+                    return []
+                break
+            else:
+                return None
+        return array(typecode)
+
+    @staticmethod
+    def _widen_buffer(buf, mask, tail):
+        """ Join an inferred buffer and the raw values that didn't fit: 'd' for numbers, else a list """
+        if all(v is None or isinstance(v, (int, float, Decimal)) for v in tail):
+            wide = array('d', buf)
+            wide.extend(0.0 if v is None else v for v in tail)
+            return wide
+        # the buffer only ever held values of its own type, so they come back as they were
+        wide = [None if null else v for v, null in zip(buf, mask)]
+        wide.extend(tail)
+        return wide
 
     def sql_query_row(self, sql, parms=()):
-        self._cur.execute(sql, parms)
-        row = self._cur.fetchone()
-        self._cur.fetchall()
+        cache = self._cache
+        if cache is not None:
+            cache.check_version(self)
+            key = cache.key('row', sql, parms)
+            if key is not None:
+                row = cache.get(key)
+                if row is cache.MISS:
+                    row = self._query_row(sql, parms)
+                    cache.put(key, row, sql)
+                return row
+        return self._query_row(sql, parms)
+
+    def _query_row(self, sql, parms):
+        timer = self._timer
+        if timer is not None:
+            start = time.perf_counter()
+        cur = self._cur if self._reader() is self._db else self._read_cur
+        cur.execute(sql, parms)
+        row = cur.fetchone()
+        cur.fetchall()
+        if timer is not None:
+            timer.record(sql, time.perf_counter() - start, 0 if row is None else 1)
+        if row is not None and self._dict_rows and self._dbms == 'mysql':
+            row = make_row_class(cur.column_names)(row)
         return row
 
     def sql_query_value(self, sql, parms=()):
@@ -170,15 +1221,10 @@ class BWDB:
         if self._column_names is not None:
             return self._column_names
 
-        if self._dbms == 'sqlite':
-            rows = self.sql_query(f"PRAGMA table_info ({self._table});")
-            self._column_names = tuple(r[1] for r in rows)
-        elif self._dbms == 'mysql':
-            self._cur.execute(f"SELECT * FROM {self._table} LIMIT 1")
-            self._cur.fetchall()
-            self._column_names = self._cur.column_names
-        else:
-            raise BWErr("column_names: unknown _dbms")
+        info = self.table_info()
+        if info is None:
+            raise BWErr(f"column_names: no table {self._table}")
+        self._column_names = info['columns']
 
         if self._column_names[0] != 'id':
             self._column_names = None
@@ -189,48 +1235,700 @@ class BWDB:
         else:
             return self._column_names
 
-    def count_rows(self):
-        """ Returns number of rows in table """
-        return self.sql_query_value(f"SELECT COUNT(*) FROM {self._table}")
+    def schema(self):
+        """ Shared schema catalog for this database """
+        return BWSchema.for_db(self)
+
+    def refresh_schema(self):
+        """ Reload the schema catalog (needed on mysql after DDL) """
+        BWSchema.for_db(self).refresh(self)
+        self._column_names = None
+        self._statements = {}
+
+    def table_info(self, table_name=None):
+        """ Cached metadata for a table: columns, types, notnull, defaults, primary_key, indexes """
+        if table_name is None:
+            table_name = self._table
+        if table_name is None:
+            return None
+        catalog = self.schema()
+        info = catalog.table(table_name)
+        if info is None and self._dbms == 'mysql':
+            catalog.refresh(self)    # mysql has no schema_version, maybe the table is new
+            info = catalog.table(table_name)
+        return info
+
+    def count_rows(self, approximate=False):
+        """
+            Returns number of rows in table
+            uses the maintained counter if enable_row_counter() was called,
+            approximate=True accepts an estimate from the optimizer statistics
+        """
+        if approximate:
+            n = self._approximate_count()
+            if n is not None:
+                return n
+        if self._have_counter_table():
+            row = self.sql_query_row(self.statement('counter'), (self._table,))
+            if row is not None:
+                return row[0]
+        return self.sql_query_value(self.statement('count'))
+
+    def _approximate_count(self):
+        """ Row estimate from sqlite_stat1 (needs ANALYZE) or information_schema """
+        if self._dbms == 'sqlite':
+            try:
+                stats = [r[0] for r in self.sql_query("SELECT stat FROM sqlite_stat1 WHERE tbl = ?",
+                                                      (self._table,))]
+            except sqlite3.OperationalError:     # never analyzed
+                return None
+            if not stats:
+                return None
+            return max(int(stat.split()[0]) for stat in stats)
+        elif self._dbms == 'mysql':
+            row = self.sql_query_row("SELECT table_rows FROM information_schema.tables "
+                                     "WHERE table_schema = DATABASE() AND table_name = ?", (self._table,))
+            if row is None or row[0] is None:
+                return None
+            return int(row[0])
+        return None
+
+    def _have_counter_table(self):
+        # straight from the catalog: table_info() reloads all of it on mysql for a missing table
+        return self.schema().table(ROW_COUNTER_TABLE) is not None
+
+    def have_row_counter(self):
+        if not self._have_counter_table():
+            return False
+        return self.sql_query_row(self.statement('counter'), (self._table,)) is not None
+
+    def enable_row_counter(self):
+        """
+            Keep the table's row count in a side table with insert/delete triggers.
+            sqlite's REPLACE conflict handling (INSERT OR REPLACE, REPLACE INTO) deletes
+            without firing delete triggers unless PRAGMA recursive_triggers is on, so the
+            count drifts up; sync_row_counter() recounts (load_sql() does this itself).
+        """
+        table = self._table
+        counter = ROW_COUNTER_TABLE
+        if self._dbms == 'sqlite':
+            self.sql_do(f"CREATE TABLE IF NOT EXISTS {counter} (tbl TEXT PRIMARY KEY, n INTEGER NOT NULL)")
+            body_ai = f"BEGIN UPDATE {counter} SET n = n + 1 WHERE tbl = '{table}'; END"
+            body_ad = f"BEGIN UPDATE {counter} SET n = n - 1 WHERE tbl = '{table}'; END"
+        elif self._dbms == 'mysql':
+            self.sql_do(f"CREATE TABLE IF NOT EXISTS {counter} (tbl VARCHAR(64) PRIMARY KEY, n BIGINT NOT NULL)")
+            body_ai = f"FOR EACH ROW UPDATE {counter} SET n = n + 1 WHERE tbl = '{table}'"
+            body_ad = f"FOR EACH ROW UPDATE {counter} SET n = n - 1 WHERE tbl = '{table}'"
+        else:
+            raise BWErr("enable_row_counter: unknown _dbms")
+        self.disable_row_counter()
+
+        # count and install the triggers together so no insert is missed
+        if self._dbms == 'sqlite':
+            self.sql_do_nocommit("BEGIN IMMEDIATE")
+        try:
+            self._execute_plain(f"CREATE TRIGGER {table}_count_ai AFTER INSERT ON {table} {body_ai}")
+            self._execute_plain(f"CREATE TRIGGER {table}_count_ad AFTER DELETE ON {table} {body_ad}")
+            self.sql_do_nocommit(f"INSERT INTO {counter} (tbl, n) VALUES (?, 0)", (table,))
+            self.sql_do_nocommit(f"UPDATE {counter} SET n = ({self.statement('count')}) WHERE tbl = ?", (table,))
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+        self.refresh_schema()   # mysql doesn't notice the new counter table by itself
+
+    def sync_row_counter(self, table=None):
+        """ Reset the row counter to COUNT(*), for table or (default) every counted table """
+        if not self._have_counter_table():
+            return
+        if table is None:
+            tables = [r[0] for r in self.sql_query(f"SELECT tbl FROM {ROW_COUNTER_TABLE}")]
+        else:
+            tables = [table]
+        for table in tables:
+            table = self.sanitize_string(table)
+            self.sql_do_nocommit(f"UPDATE {ROW_COUNTER_TABLE} SET n = (SELECT COUNT(*) FROM {table}) "
+                                 f"WHERE tbl = ?", (table,))
+        self.commit()
+
+    def disable_row_counter(self):
+        """ Drop the row counter triggers, count_rows() goes back to COUNT(*) """
+        table = self._table
+        self._execute_plain(f"DROP TRIGGER IF EXISTS {table}_count_ai")
+        self._execute_plain(f"DROP TRIGGER IF EXISTS {table}_count_ad")
+        self.commit()
+        if self._have_counter_table():
+            self.sql_do(f"DELETE FROM {ROW_COUNTER_TABLE} WHERE tbl = ?", (table,))
 
     def get_row(self, row_id):
         """ Get rows from table – returns cursor """
-        return self.sql_query_row(f"SELECT * FROM {self._table} WHERE id = ?", (row_id,))
+        return self.sql_query_row(self.statement('get'), (row_id,))
 
-    def get_rows(self):
+    def get_rows(self, arraysize=None):
         """ Get rows from table – returns cursor """
-        return self.sql_query(f"SELECT * FROM {self._table}")
+        return self.sql_query(self.statement('get_all'), arraysize=arraysize)
+
+    def get_rows_batches(self, arraysize=None):
+        """ Get rows from table as lists of up to arraysize rows """
+        return self.sql_query_batches(self.statement('get_all'), arraysize=arraysize)
 
     def get_rows_limit(self, limit, offset=0):
-        return self.sql_query(f"SELECT * FROM {self._table} LIMIT ? OFFSET ?",
-                              (limit, offset))
+        return self.sql_query(self.statement('get_limit'), (limit, offset))
+
+    def get_rows_after(self, token=None, limit=25, order_by='id'):
+        """ Keyset paging: returns (rows, token), token is None after the last page """
+        order_by = self.sanitize_string(order_by)
+        if token is None:
+            sql = self.statement('first', order_by)
+            parms = (limit + 1,)
+        else:
+            sql = self.statement('after', order_by)
+            parms = self._seek_parms(token, order_by) + (limit + 1,)
+        rows = list(self.sql_query(sql, parms))
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, self._seek_token(rows[-1], order_by)
+        return rows, None
+
+    def get_rows_before(self, token, limit=25, order_by='id'):
+        """ Keyset paging backwards: returns (rows, token), token is None at the first page """
+        order_by = self.sanitize_string(order_by)
+        parms = self._seek_parms(token, order_by) + (limit + 1,)
+        rows = list(self.sql_query(self.statement('before', order_by), parms))
+        more = len(rows) > limit
+        rows = rows[:limit]
+        rows.reverse()
+        if more:
+            return rows, self._seek_token(rows[0], order_by)
+        return rows, None
+
+    def _seek_parms(self, token, order_by):
+        if order_by == 'id':
+            return (token,)
+        return tuple(token)
+
+    def _seek_token(self, row, order_by):
+        """ id for id order, (value, id) for any other column """
+        if order_by == 'id':
+            return row[0]
+        return row[self.column_names().index(order_by)], row[0]
 
     def add_row_nocommit(self, parms=()):
-        colnames = self.column_names()
-        numnames = len(colnames)
-        if 'id' in colnames:
-            numnames -= 1
-        names_str = self.sql_colnames_string(colnames)
-        values_str = self.sql_values_string(numnames)
-        sql = f"INSERT INTO {self._table} ({names_str}) VALUES ({values_str})"
-        return self.sql_do_nocommit(sql, parms)
+        return self.sql_do_nocommit(self.statement('add'), parms)
 
     def add_row(self, parms=()):
         r = self.add_row_nocommit(parms)
         self.commit()
         return r
 
+    def add_rows_iter(self, rows, chunk_size=1000):
+        """ Add rows from any iterable in chunks, commit and yield rowcount per chunk """
+        if chunk_size < 1:
+            raise BWErr("add_rows_iter: chunk_size must be positive")
+        if self._dbms == 'mysql':
+            # the multi-row VALUES binds every value, keep it under the placeholder limit
+            ncols = len([c for c in self.column_names() if c != 'id'])
+            chunk_size = min(chunk_size, max(1, self.max_parms() // max(ncols, 1)))
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            if self._dbms == 'mysql':
+                # one multi-row VALUES statement instead of a prepared loop
+                parms = [v for row in chunk for v in row]
+                count = self.sql_do_nocommit(self.statement('add_multi', len(chunk)), parms)
+            else:
+                count = self.sql_do_many_nocommit(self.statement('add'), chunk)
+            self.commit()
+            yield count
+
+    def add_rows(self, rows, chunk_size=1000):
+        """ Add rows from any iterable, returns total rowcount """
+        return sum(self.add_rows_iter(rows, chunk_size))
+
+    def upsert_rows(self, rows, conflict_cols, update_cols=None, columns=None, chunk_size=1000):
+        """
+            Insert rows, or update the existing row when conflict_cols match a unique key.
+            rows are sequences in the order of columns (default: all columns but id),
+            update_cols defaults to the columns not in conflict_cols ((): leave existing rows alone).
+            Runs in chunks with a commit per chunk, returns (inserted, updated).
+            The counts come from looking up each chunk's conflict keys before it's written,
+            in the same transaction as the write (BEGIN IMMEDIATE on sqlite, a locking read
+            on mysql) so concurrent writers can't change them in between. updated includes
+            matched rows whose values didn't change, and is 0 when update_cols is () since
+            matched rows are skipped.
+        """
+        if columns is None:
+            columns = self.column_names()[1:]
+        columns = tuple(self.sanitize_string(c) for c in columns)
+        conflict_cols = tuple(self.sanitize_string(c) for c in conflict_cols)
+        if update_cols is None:
+            update_cols = tuple(c for c in columns if c not in conflict_cols)
+        update_cols = tuple(self.sanitize_string(c) for c in update_cols)
+        for c in columns + conflict_cols + update_cols:
+            if c not in self.column_names():
+                raise BWErr(f"upsert_rows: unknown column {c}")
+        if not conflict_cols:
+            raise BWErr("upsert_rows: no conflict_cols")
+        for c in conflict_cols:
+            if c not in columns:
+                raise BWErr(f"upsert_rows: conflict column {c} not in columns")
+        key_index = [columns.index(c) for c in conflict_cols]
+        if self._dbms == 'mysql':
+            # the multi-row VALUES binds every value, keep it under the placeholder limit
+            chunk_size = min(chunk_size, max(1, self.max_parms() // len(columns)))
+
+        inserted = updated = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            # hold the write lock from the key lookup to the write
+            begin = self._dbms == 'sqlite' and not self._db.in_transaction
+            if begin:
+                self.sql_do_nocommit("BEGIN IMMEDIATE")
+            try:
+                new = self._upsert_new_rows(chunk, conflict_cols, key_index)
+                if self._dbms == 'mysql':
+                    sql = self.statement('upsert', (columns, conflict_cols, update_cols, len(chunk)))
+                    self.sql_do_nocommit(sql, [v for row in chunk for v in row])
+                else:
+                    sql = self.statement('upsert', (columns, conflict_cols, update_cols, 1))
+                    self.sql_do_many_nocommit(sql, chunk)
+            except BaseException:
+                if begin:
+                    self.rollback()
+                raise
+            self.commit()
+            inserted += new
+            if update_cols:
+                updated += len(chunk) - new
+        return inserted, updated
+
+    def _upsert_new_rows(self, chunk, conflict_cols, key_index):
+        """ Number of rows in chunk that will insert rather than match an existing row """
+        keys = set()
+        null_keys = 0
+        for row in chunk:
+            key = tuple(row[i] for i in key_index)
+            if None in key:
+                null_keys += 1      # NULL never conflicts
+            else:
+                keys.add(key)
+        if not keys:
+            return null_keys
+        keys = list(keys)
+        size = max(1, self.max_parms() // len(conflict_cols))
+        existing = 0
+        for i in range(0, len(keys), size):
+            part = keys[i:i + size]
+            sql = self.statement('upsert_keys', (conflict_cols, len(part)))
+            # not through the cache, this has to see the rows as they are now
+            existing += self._query_row(sql, [v for key in part for v in key])[0]
+        # repeats of a new key within the chunk update the row its first occurrence inserted
+        return null_keys + len(keys) - existing
+
+    # table copy =====
+    @staticmethod
+    def copy_table(src, dest, table, dest_table=None, chunk_size=1000, commit_every=10,
+                   create=True, resume=True, progress=None):
+        """
+            Copy table from BWDB src to BWDB dest (same or different dbms), returns rows copied.
+            Reads with fetchmany, writes chunk_size rows per executemany (one multi-row
+            INSERT on mysql) and commits every commit_every chunks. With create, a missing
+            dest table is made with mapped column types and the source's indexes are added
+            after the data.
+            With resume, a copy ordered by a single-column primary key continues after the
+            highest key already in dest. progress(rows, last_key) is called after each commit.
+        """
+        info = src.table_info(table)
+        if info is None:
+            raise BWErr(f"copy_table: no table {table}")
+        table = info['name']
+        dest_table = dest.sanitize_string(dest_table or table)
+        columns = info['columns']
+        key = info['primary_key'][0] if len(info['primary_key']) == 1 else None
+
+        created = False
+        if not dest.have_table(dest_table):
+            if not create:
+                raise BWErr(f"copy_table: no table {dest_table} in dest")
+            dest.sql_do(BWDB._copy_create_sql(info, src.dbms, dest.dbms, dest_table))
+            dest.refresh_schema()
+            created = True
+
+        names_str = ",".join(columns)
+        sql = f"SELECT {names_str} FROM {table}"
+        parms = ()
+        if key is not None:
+            last = None
+            if resume and not created:
+                last = dest.sql_query_value(f"SELECT MAX({key}) FROM {dest_table}")
+            if last is not None:
+                sql += f" WHERE {key} > ?"
+                parms = (last,)
+            sql += f" ORDER BY {key}"
+        elif not created and dest.sql_query_value(f"SELECT COUNT(*) FROM {dest_table}"):
+            raise BWErr("copy_table: dest is not empty and there is no primary key to resume from")
+
+        ncols = len(columns)
+        values_str = f"({dest.sql_values_string(ncols)})"
+        insert = f"INSERT INTO {dest_table} ({names_str}) VALUES "
+        max_rows = max(1, dest.max_parms() // ncols)
+        key_index = columns.index(key) if key is not None else None
+        copied = 0
+        chunks = 0
+        last_key = None
+        for rows in src.sql_query_batches(sql, parms, arraysize=chunk_size):
+            if dest.dbms == 'mysql':
+                for i in range(0, len(rows), max_rows):
+                    part = rows[i:i + max_rows]
+                    dest.sql_do_nocommit(insert + ",".join([values_str] * len(part)),
+                                         [v for row in part for v in row])
+            else:
+                dest.sql_do_many_nocommit(insert + values_str, rows)
+            copied += len(rows)
+            if key_index is not None:
+                last_key = rows[-1][key_index]
+            chunks += 1
+            if chunks % commit_every == 0:
+                dest.commit()
+                if progress is not None:
+                    progress(copied, last_key)
+        dest.commit()
+        if progress is not None and chunks % commit_every:
+            progress(copied, last_key)
+
+        if create:
+            # also after a resumed copy that was interrupted before its indexes were made
+            have = {tuple(index['columns']) for index in dest.table_info(dest_table)['indexes'].values()}
+            for columns, sql in BWDB._copy_index_sql(info, dest_table):
+                if columns not in have:
+                    dest.sql_do(sql)
+            dest.refresh_schema()
+        return copied
+
+    @staticmethod
+    def _copy_type(ctype, src_dbms, dest_dbms, indexed):
+        ctype = (ctype or '').upper()
+        if src_dbms == dest_dbms:
+            return ctype
+        if '(' in ctype and dest_dbms == 'mysql':
+            return ctype
+        if dest_dbms == 'mysql':
+            if not ctype:   # typeless sqlite column, could hold anything
+                return 'VARCHAR(255)' if indexed else 'TEXT'
+            for match, dest_type in SQLITE_TO_MYSQL_TYPES:
+                if match in ctype:
+                    # mysql can't index or key a TEXT column without a prefix length
+                    if indexed and dest_type in ('TEXT', 'LONGTEXT'):
+                        return 'VARCHAR(255)'
+                    return dest_type
+        for match, dest_type in MYSQL_TO_SQLITE_TYPES:
+            if match in ctype:
+                return dest_type
+
+    @staticmethod
+    def _copy_default(default, src_dbms, dest_dbms, dest_type):
+        """ A column default in dest's SQL, None to leave it out """
+        if default is None or src_dbms == dest_dbms:
+            return default
+        # literals and CURRENT_* mean the same in both, other expressions are dropped
+        if not re.fullmatch(r"-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|'(?:[^']|'')*'|NULL"
+                            r"|CURRENT_(?:TIMESTAMP|DATE|TIME)", default.strip(), re.IGNORECASE):
+            return None
+        default = default.strip()
+        if dest_dbms == 'mysql':
+            default = default.replace('\\', '\\\\')
+            # mysql only takes a TEXT/BLOB or CURRENT_DATE default as an expression
+            if 'TEXT' in dest_type or 'BLOB' in dest_type or default.upper() in ('CURRENT_DATE', 'CURRENT_TIME'):
+                default = f"({default})"
+        return default
+
+    @staticmethod
+    def _copy_create_sql(info, src_dbms, dest_dbms, dest_table):
+        pk = info['primary_key']
+        indexed = set(pk)
+        for index in info['indexes'].values():
+            indexed.update(index['columns'])
+        cols = []
+        for name, ctype, notnull, default in zip(info['columns'], info['types'], info['notnull'],
+                                                 info['defaults']):
+            ctype = BWDB._copy_type(ctype, src_dbms, dest_dbms, name in indexed)
+            default = BWDB._copy_default(default, src_dbms, dest_dbms, ctype)
+            if len(pk) == 1 and name == pk[0] and dest_dbms == 'sqlite' and ctype == 'INTEGER':
+                ctype = 'INTEGER PRIMARY KEY'     # the rowid
+            elif len(pk) == 1 and name == pk[0] and dest_dbms == 'mysql' and 'INT' in ctype:
+                ctype += ' AUTO_INCREMENT PRIMARY KEY'
+            elif len(pk) == 1 and name == pk[0]:
+                ctype += ' PRIMARY KEY'
+            else:
+                if notnull:
+                    ctype += ' NOT NULL'
+                if default is not None:
+                    ctype += f" DEFAULT {default}"
+            cols.append(f"{name} {ctype}")
+        if len(pk) > 1:
+            cols.append(f"PRIMARY KEY ({','.join(pk)})")
+        return f"CREATE TABLE {dest_table} ({', '.join(cols)})"
+
+    @staticmethod
+    def _copy_index_sql(info, dest_table):
+        pk = tuple(info['primary_key'])
+        for name, index in info['indexes'].items():
+            if name == 'PRIMARY' or tuple(index['columns']) == pk:
+                continue
+            unique = "UNIQUE " if index['unique'] else ""
+            # index names are per database on sqlite, so always name them after dest_table
+            index_name = f"{dest_table}_{'_'.join(index['columns'])}"
+            yield tuple(index['columns']), \
+                f"CREATE {unique}INDEX {index_name} ON {dest_table} ({','.join(index['columns'])})"
+
+    # dump loader =====
+    def load_sql(self, source, batch_rows=500, backslash_escapes=None, batch_bytes=LOAD_BATCH_BYTES):
+        """
+            Load an SQL dump (file name or open text file) as a stream, returns
+            (statements, rows inserted). Consecutive INSERTs into the same table are
+            sent as multi-row VALUES batches of up to batch_rows statements and
+            batch_bytes of values, all in one transaction. BEGIN/COMMIT, USE, CREATE
+            DATABASE and LOCK TABLES in the dump are skipped, CREATE INDEX runs after
+            the data (CREATE UNIQUE INDEX runs in place, so a later duplicate fails
+            where it is). backslash_escapes (default on for mysql) treats \\ as an
+            escape inside quoted strings.
+        """
+        if backslash_escapes is None:
+            backslash_escapes = self._dbms == 'mysql'
+        fh = open(source, encoding='utf-8') if isinstance(source, str) else source
+        statements = 0
+        inserted = 0
+        indexes = []
+        prefix = None       # INSERT ... VALUES of the batch being collected
+        raw_prefix = None
+        values = []
+        size = 0
+        try:
+            with self.transaction():
+                for sql in self._sql_statements(fh, backslash_escapes):
+                    statements += 1
+                    m = self._load_insert.match(sql)
+                    if m is not None:
+                        raw, row = m.groups()
+                        full = len(values) >= batch_rows or (values and size + len(row) > batch_bytes)
+                        if raw != raw_prefix or full:
+                            this_prefix = " ".join(raw.split())
+                            if this_prefix != prefix or full:
+                                inserted += self._load_batch(prefix, values)
+                                prefix = this_prefix
+                                values = []
+                                size = 0
+                            raw_prefix = raw
+                        values.append(row)
+                        size += len(row) + 1
+                        continue
+                    inserted += self._load_batch(prefix, values)
+                    prefix = raw_prefix = None
+                    values = []
+                    size = 0
+                    if self._load_skip.match(sql):     # whole statement, not a prefix
+                        continue
+                    if self._load_index.match(sql):
+                        indexes.append(sql)
+                        continue
+                    self._execute_plain(sql)
+                inserted += self._load_batch(prefix, values)
+                for sql in indexes:
+                    self._execute_plain(sql)
+        finally:
+            if fh is not source:
+                fh.close()
+        self.refresh_schema()
+        self.sync_row_counter()     # REPLACE in the dump skips the delete triggers
+        return statements, inserted
+
+    def _load_batch(self, prefix, values):
+        if not values:
+            return 0
+        return self._execute_plain(f"{prefix} VALUES {','.join(values)}")
+
+    @classmethod
+    def _sql_statements(cls, lines, backslash_escapes=False):
+        """ Split lines of SQL into statements at ; outside quotes, dropping comments between them """
+        special = cls._sql_special
+        buf = []
+        quote = None    # open quote character, or */ inside a block comment
+        for line in lines:
+            # fast path: the whole line is one statement with nothing to scan for
+            if quote is None and not buf and line.count(';') == 1 and line.rstrip().endswith(';') \
+                    and line.count("'") % 2 == 0 and '--' not in line and '/*' not in line \
+                    and '"' not in line and '`' not in line and not (backslash_escapes and '\\' in line):
+                sql = line.strip()[:-1].rstrip()
+                if sql:
+                    yield sql
+                continue
+            pos = 0
+            n = len(line)
+            while pos < n:
+                if quote is None:
+                    m = special.search(line, pos)
+                    if m is None:
+                        buf.append(line[pos:])
+                        break
+                    token, start = m.group(), m.start()
+                    buf.append(line[pos:start])
+                    if token == ';':
+                        sql = "".join(buf).strip()
+                        if cls._load_trigger.match(sql) and not cls._trigger_complete(sql):
+                            buf.append(';')     # inside the trigger's BEGIN ... END
+                        else:
+                            buf = []
+                            if sql:
+                                yield sql
+                        pos = start + 1
+                    elif token == '--':
+                        # keep comments inside a statement (sqlite stores them with the schema)
+                        if "".join(buf).strip():
+                            buf.append(line[start:])
+                        else:
+                            buf = []
+                        break
+                    elif token == '/*':
+                        quote = '*/'
+                        pos = start + 2
+                    else:
+                        buf.append(token)
+                        quote = token
+                        pos = start + 1
+                elif quote == '*/':
+                    end = line.find('*/', pos)
+                    if end < 0:
+                        break
+                    buf.append(" ")
+                    quote = None
+                    pos = end + 2
+                else:
+                    i = pos
+                    while True:
+                        end = line.find(quote, i)
+                        escape = line.find('\\', i) if backslash_escapes else -1
+                        if escape < 0 or 0 <= end < escape:
+                            break
+                        i = escape + 2
+                    if end < 0:
+                        buf.append(line[pos:])
+                        break
+                    buf.append(line[pos:end + 1])
+                    quote = None
+                    pos = end + 1
+        sql = "".join(buf).strip()
+        if sql:
+            yield sql
+
+    @staticmethod
+    def _trigger_complete(sql):
+        if have_sqlite3:
+            return sqlite3.complete_statement(sql + ';')
+        return re.search(r"\bEND\s*$", sql, re.IGNORECASE) is not None
+
+    # export =====
+    def export(self, table_or_sql, fmt='csv', out=None, parms=(), compress=None, arraysize=None, header=True):
+        """
+            Stream a table or query to csv or jsonl, returns rows written.
+            out is a file name or an open text file, default table.fmt in the current
+            directory. compress gzips the output (default: when out ends in .gz).
+            Rows go from fetchmany on a dedicated cursor straight to a buffered writer,
+            so memory stays at one batch. The result cache is bypassed.
+        """
+        if fmt not in ('csv', 'jsonl'):
+            raise BWErr(f"export: unknown format {fmt}")
+        if re.fullmatch(r"\w+", table_or_sql):
+            table = table_or_sql
+            sql = f"SELECT * FROM {table}"
+        else:
+            table = None
+            sql = table_or_sql
+        if out is None:
+            if table is None:
+                raise BWErr("export: out is needed for a query")
+            out = f"{table}.{fmt}.gz" if compress else f"{table}.{fmt}"
+        if arraysize is None:
+            arraysize = self.arraysize
+
+        if isinstance(out, str):
+            if compress is None:
+                compress = out.endswith('.gz')
+            if compress:
+                fh = gzip.open(out, 'wt', encoding='utf-8', newline='', compresslevel=6)
+            else:
+                fh = open(out, 'w', encoding='utf-8', newline='', buffering=1024 * 1024)
+        else:
+            fh = out
+
+        timer = self._timer
+        if timer is not None:
+            start = time.perf_counter()
+        count = 0
+        cur = self._new_cursor(self._reader())
+        try:
+            cur.execute(sql, parms)
+            names = [d[0] for d in cur.description]
+            if fmt == 'csv':
+                writer = csv.writer(fh)
+                if header:
+                    writer.writerow(names)
+            else:
+                encode = json.JSONEncoder(ensure_ascii=False, default=str).encode
+            while True:
+                rows = cur.fetchmany(arraysize)
+                if not rows:
+                    break
+                if fmt == 'csv':
+                    writer.writerows(rows)
+                else:
+                    fh.write("".join([encode(dict(zip(names, row))) + "\n" for row in rows]))
+                count += len(rows)
+        finally:
+            cur.close()
+            if fh is not out:
+                fh.close()
+        if timer is not None:
+            timer.record(sql, time.perf_counter() - start, count)
+        return count
+
+    def export_tables(self, tables, fmt='csv', directory='.', compress=False, max_workers=4):
+        """
+            Export several tables to directory/table.fmt[.gz] in parallel, each on its
+            own thread and connection, returns {table: rows written}.
+        """
+        suffix = f".{fmt}.gz" if compress else f".{fmt}"
+        jobs = {table: os.path.join(directory, self.sanitize_string(table) + suffix) for table in tables}
+        if self._in_memory or self._database in (':memory:', ''):
+            # a new connection would not see this database
+            return {table: self.export(table, fmt, out) for table, out in jobs.items()}
+
+        def export_one(table, out):
+            db = BWDB(dbms=self._dbms, database=self._database, host=self._host, user=self._user,
+                      password=self._password, profile=self._profile, read_only=self._read_only,
+                      immutable=self._immutable, replica_host=self._replica_host)
+            try:
+                return db.export(table, fmt, out, arraysize=self.arraysize)
+            finally:
+                db.disconnect()
+
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='BWDBExport') as executor:
+            futures = {table: executor.submit(export_one, table, out) for table, out in jobs.items()}
+            return {table: future.result() for table, future in futures.items()}
+
     def update_row_nocommit(self, row_id, dict_rec):
         """ Update row id with data in dict """
         if "id" in dict_rec.keys():  # don't update id column
             del dict_rec['id']
 
-        keys = sorted(dict_rec.keys())  # get keys and values
+        keys = tuple(sorted(dict_rec.keys()))  # get keys and values
         values = [dict_rec[v] for v in keys]
-        update_string = self.sql_update_string(keys)
-        sql = f"UPDATE {self._table} SET {update_string} WHERE id = ?"
         values.append(row_id)
-        return self.sql_do_nocommit(sql, values)
+        return self.sql_do_nocommit(self.statement('update', keys), values)
 
     def update_row(self, row_id, dict_rec):
         r = self.update_row_nocommit(row_id, dict_rec)
@@ -238,18 +1936,128 @@ class BWDB:
         return r
 
     def del_row_nocommit(self, row_id):
-        return self.sql_do_nocommit(f"DELETE FROM {self._table} WHERE id = ?", (row_id,))
+        return self.sql_do_nocommit(self.statement('del'), (row_id,))
 
     def del_row(self, row_id):
         r = self.del_row_nocommit(row_id)
         self.commit()
         return r
 
+    # set-based methods =====
+    def get_rows_by_ids(self, ids):
+        """ Get many rows by id, returns dict id -> row """
+        ids = list(ids)
+        rows = {}
+        if not ids:
+            return rows
+        if len(ids) > ID_TEMP_TABLE_THRESHOLD:
+            if self._dbms == 'sqlite':
+                # one JSON array parameter, so a read doesn't write a temp table
+                for row in self.sql_query(self.statement('get_json_ids'), (json.dumps(ids),)):
+                    rows[row[0]] = row
+                return rows
+            in_transaction = self._db.in_transaction
+            self._load_temp_ids(ids)
+            try:
+                for row in self.sql_query(self.statement('get_temp_ids')):
+                    rows[row[0]] = row
+            finally:
+                self._drop_temp_ids()
+                if not in_transaction:
+                    self._db.commit()   # end the transaction the temp table insert started
+            return rows
+        for chunk in self._id_chunks(ids):
+            for row in self.sql_query(self.statement('get_ids', len(chunk)), chunk):
+                rows[row[0]] = row
+        return rows
+
+    def update_rows_nocommit(self, ids, dict_rec):
+        """ Set the same values on many rows, returns rowcount """
+        dict_rec = dict(dict_rec)
+        if "id" in dict_rec.keys():  # don't update id column
+            del dict_rec['id']
+        keys = tuple(sorted(dict_rec.keys()))
+        values = tuple(dict_rec[v] for v in keys)
+        ids = list(ids)
+        if not ids:
+            return 0
+        if len(ids) > ID_TEMP_TABLE_THRESHOLD:
+            self._load_temp_ids(ids)
+            try:
+                return self.sql_do_nocommit(self.statement('update_temp_ids', keys), values)
+            finally:
+                self._drop_temp_ids()
+        count = 0
+        for chunk in self._id_chunks(ids, len(values)):
+            count += self.sql_do_nocommit(self.statement('update_ids', (keys, len(chunk))), values + chunk)
+        return count
+
+    def update_rows(self, ids, dict_rec):
+        r = self.update_rows_nocommit(ids, dict_rec)
+        self.commit()
+        return r
+
+    def del_rows_nocommit(self, ids):
+        """ Delete many rows by id, returns rowcount """
+        ids = list(ids)
+        if not ids:
+            return 0
+        if len(ids) > ID_TEMP_TABLE_THRESHOLD:
+            self._load_temp_ids(ids)
+            try:
+                return self.sql_do_nocommit(self.statement('del_temp_ids'))
+            finally:
+                self._drop_temp_ids()
+        count = 0
+        for chunk in self._id_chunks(ids):
+            count += self.sql_do_nocommit(self.statement('del_ids', len(chunk)), chunk)
+        return count
+
+    def del_rows(self, ids):
+        r = self.del_rows_nocommit(ids)
+        self.commit()
+        return r
+
+    def max_parms(self):
+        """ Most bound parameters the driver takes in one statement """
+        if self._dbms == 'sqlite' and hasattr(self._db, 'getlimit'):     # python 3.11+
+            return self._db.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+        elif self._dbms == 'mysql':
+            return 65535
+        return 999     # sqlite before 3.32
+
+    def _id_chunks(self, ids, extra=0):
+        """ Split ids into IN lists, the last one padded with NULL so the statement is reused """
+        if not ids:
+            return
+        size = min(self.max_parms() - extra, ID_CHUNK_SIZE)
+        if len(ids) <= size:
+            size = len(ids)    # one statement sized to fit
+        for i in range(0, len(ids), size):
+            chunk = tuple(ids[i:i + size])
+            if len(chunk) < size:
+                chunk += (None,) * (size - len(chunk))
+            yield chunk
+
+    def _load_temp_ids(self, ids):
+        self._drop_temp_ids()
+        if self._dbms == 'mysql':
+            self.sql_do_nocommit(f"CREATE TEMPORARY TABLE {ID_TEMP_TABLE} (id BIGINT PRIMARY KEY)")
+            insert = f"INSERT IGNORE INTO {ID_TEMP_TABLE} (id) VALUES (?)"
+        else:
+            self.sql_do_nocommit(f"CREATE TEMP TABLE {ID_TEMP_TABLE} (id INTEGER PRIMARY KEY)")
+            insert = f"INSERT OR IGNORE INTO {ID_TEMP_TABLE} (id) VALUES (?)"
+        self.sql_do_many_nocommit(insert, [(i,) for i in ids])
+
+    def _drop_temp_ids(self):
+        if self._dbms == 'mysql':
+            self.sql_do_nocommit(f"DROP TEMPORARY TABLE IF EXISTS {ID_TEMP_TABLE}")
+        else:
+            self.sql_do_nocommit(f"DROP TABLE IF EXISTS temp.{ID_TEMP_TABLE}")
+
     def find_row(self, colname, value):
         """ Find the first match and returns id or None """
-        colname = self.sanitize_string(colname)  # sanitize params
-        sql = f"SELECT * FROM {self._table} WHERE {colname} LIKE ?"
-        row = self.sql_query_row(sql, (value,))
+        row = self.sql_query_row(self.statement('find', colname), (value,))
         if row:
             return row[0]
         else:
@@ -257,13 +2065,189 @@ class BWDB:
 
     def find_rows(self, colname, value):
         """ Find the first match and returns id or empty list """
-        colname = self.sanitize_string(colname)  # sanitize params
-        sql = f"SELECT * FROM {self._table} WHERE {colname} LIKE ?"
         row_ids = []
-        for row in self.sql_query(sql, (value,)):
+        for row in self.sql_query(self.statement('find', colname), (value,)):
             row_ids.append(row[0])
         return row_ids
 
+    # full-text search =====
+    def search_columns(self):
+        """ Columns of the table covered by an FTS5 search index (empty tuple if none) """
+        if self._dbms != 'sqlite' or self._table is None:
+            return ()
+        info = self.table_info(f"{self._table}_fts")
+        if info is None:
+            return ()
+        return info['columns']
+
+    def enable_search(self, *colnames):
+        """
+            Create an FTS5 trigram index over colnames, kept in sync with triggers.
+            find_row/find_rows on those columns then use the index for LIKE patterns.
+            Returns False (find_row/find_rows keep using LIKE) if FTS5 is unavailable.
+        """
+        if self._dbms != 'sqlite':
+            return False
+        table = self._table
+        cols = [self.sanitize_string(c) for c in colnames]
+        for c in cols:
+            if c not in self.column_names():
+                raise BWErr(f"enable_search: unknown column {c}")
+        fts = f"{table}_fts"
+        names = ", ".join(cols)
+        new_values = ", ".join(f"new.{c}" for c in cols)
+        old_values = ", ".join(f"old.{c}" for c in cols)
+        self.disable_search()
+        try:
+            self.sql_do(f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content='{table}', "
+                        f"content_rowid='id', tokenize='trigram')")
+        except sqlite3.OperationalError:    # no fts5 or no trigram tokenizer (sqlite < 3.34)
+            return False
+        self.sql_do(f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+                    f"INSERT INTO {fts} (rowid, {names}) VALUES (new.id, {new_values}); END")
+        self.sql_do(f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+                    f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values}); END")
+        self.sql_do(f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN "
+                    f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values}); "
+                    f"INSERT INTO {fts} (rowid, {names}) VALUES (new.id, {new_values}); END")
+        self.sql_do(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+        self._statements = {}
+        return True
+
+    def disable_search(self):
+        """ Drop the search index and its triggers """
+        if self._dbms != 'sqlite':
+            return
+        fts = f"{self._table}_fts"
+        for suffix in ('ai', 'ad', 'au'):
+            self.sql_do(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        self.sql_do(f"DROP TABLE IF EXISTS {fts}")
+        self._statements = {}
+
+    # statement cache =====
+    def statement(self, kind, cols=None):
+        """ Return the generated SQL for a crud method, built once per table """
+        key = (kind, cols)
+        sql = self._statements.get(key)
+        if sql is None:
+            sql = self._build_statement(kind, cols)
+            self._statements[key] = sql
+            if self._audit is not None and kind not in AUDIT_SKIP:
+                self._audit.check(self, sql, self._table)
+        return sql
+
+    def enable_audit(self, audit=None):
+        """ EXPLAIN each generated statement when first built, returns the BWAudit """
+        self._audit = audit if audit is not None else BWAudit()
+        self._statements = {}   # so existing statements are explained too
+        return self._audit
+
+    def disable_audit(self):
+        self._audit = None
+
+    def _build_statement(self, kind, cols):
+        if self._table is None:
+            raise BWErr(f"statement: no table for {kind}")
+        if kind == 'count':
+            return f"SELECT COUNT(*) FROM {self._table}"
+        elif kind == 'counter':
+            return f"SELECT n FROM {ROW_COUNTER_TABLE} WHERE tbl = ?"
+        elif kind == 'get':
+            return f"SELECT * FROM {self._table} WHERE id = ?"
+        elif kind == 'get_all':
+            return f"SELECT * FROM {self._table}"
+        elif kind == 'get_limit':
+            return f"SELECT * FROM {self._table} LIMIT ? OFFSET ?"
+        elif kind in ('first', 'after', 'before'):
+            if cols not in self.column_names():
+                raise BWErr(f"statement: unknown order_by column {cols}")
+            if cols == 'id':
+                key, order, order_desc = "id", "id", "id DESC"
+            else:
+                key, order, order_desc = f"({cols}, id)", f"{cols}, id", f"{cols} DESC, id DESC"
+            if kind == 'first':
+                return f"SELECT * FROM {self._table} ORDER BY {order} LIMIT ?"
+            elif kind == 'after':
+                seek = "?" if cols == 'id' else "(?, ?)"
+                return f"SELECT * FROM {self._table} WHERE {key} > {seek} ORDER BY {order} LIMIT ?"
+            else:
+                seek = "?" if cols == 'id' else "(?, ?)"
+                return f"SELECT * FROM {self._table} WHERE {key} < {seek} ORDER BY {order_desc} LIMIT ?"
+        elif kind == 'add':
+            colnames = self.column_names()
+            numnames = len(colnames)
+            if 'id' in colnames:
+                numnames -= 1
+            names_str = self.sql_colnames_string(colnames)
+            values_str = self.sql_values_string(numnames)
+            return f"INSERT INTO {self._table} ({names_str}) VALUES ({values_str})"
+        elif kind == 'add_multi':
+            colnames = self.column_names()
+            numnames = len(colnames)
+            if 'id' in colnames:
+                numnames -= 1
+            names_str = self.sql_colnames_string(colnames)
+            values_str = ",".join([f"({self.sql_values_string(numnames)})"] * cols)
+            return f"INSERT INTO {self._table} ({names_str}) VALUES {values_str}"
+        elif kind == 'upsert':
+            columns, conflict_cols, update_cols, numrows = cols
+            names_str = ",".join(columns)
+            values_str = ",".join([f"({self.sql_values_string(len(columns))})"] * numrows)
+            sql = f"INSERT INTO {self._table} ({names_str}) VALUES {values_str}"
+            if self._dbms == 'mysql':
+                # mysql matches on any unique key, conflict_cols should be one
+                update_cols = update_cols or conflict_cols[:1]    # no-op update
+                updates = ",".join(f"{c}=VALUES({c})" for c in update_cols)
+                return f"{sql} ON DUPLICATE KEY UPDATE {updates}"
+            if update_cols:
+                updates = ",".join(f"{c}=excluded.{c}" for c in update_cols)
+                return f"{sql} ON CONFLICT ({','.join(conflict_cols)}) DO UPDATE SET {updates}"
+            return f"{sql} ON CONFLICT ({','.join(conflict_cols)}) DO NOTHING"
+        elif kind == 'upsert_keys':
+            conflict_cols, numkeys = cols
+            if len(conflict_cols) == 1:
+                where = f"{conflict_cols[0]} IN ({self.sql_values_string(numkeys)})"
+            else:
+                key_str = f"({self.sql_values_string(len(conflict_cols))})"
+                in_list = ",".join([key_str] * numkeys)
+                if self._dbms == 'sqlite':
+                    in_list = f"VALUES {in_list}"   # sqlite wants row values in IN from a VALUES list
+                where = f"({','.join(conflict_cols)}) IN ({in_list})"
+            sql = f"SELECT COUNT(*) FROM {self._table} WHERE {where}"
+            # mysql: lock the keys (and the gaps where new ones go) until the write commits
+            return f"{sql} FOR UPDATE" if self._dbms == 'mysql' else sql
+        elif kind == 'update':
+            update_string = self.sql_update_string(list(cols))
+            return f"UPDATE {self._table} SET {update_string} WHERE id = ?"
+        elif kind == 'del':
+            return f"DELETE FROM {self._table} WHERE id = ?"
+        elif kind in ('get_ids', 'del_ids'):
+            in_list = self.sql_values_string(cols)
+            if kind == 'get_ids':
+                return f"SELECT * FROM {self._table} WHERE id IN ({in_list})"
+            return f"DELETE FROM {self._table} WHERE id IN ({in_list})"
+        elif kind == 'update_ids':
+            keys, numids = cols
+            update_string = self.sql_update_string(list(keys))
+            return f"UPDATE {self._table} SET {update_string} WHERE id IN ({self.sql_values_string(numids)})"
+        elif kind == 'get_json_ids':
+            return f"SELECT * FROM {self._table} WHERE id IN (SELECT value FROM json_each(?))"
+        elif kind == 'get_temp_ids':
+            return f"SELECT * FROM {self._table} WHERE id IN (SELECT id FROM {ID_TEMP_TABLE})"
+        elif kind == 'update_temp_ids':
+            update_string = self.sql_update_string(list(cols))
+            return f"UPDATE {self._table} SET {update_string} WHERE id IN (SELECT id FROM {ID_TEMP_TABLE})"
+        elif kind == 'del_temp_ids':
+            return f"DELETE FROM {self._table} WHERE id IN (SELECT id FROM {ID_TEMP_TABLE})"
+        elif kind == 'find':
+            colname = self.sanitize_string(cols)  # sanitize params
+            if colname in self.search_columns():
+                # trigram fts5 tables answer LIKE from the index
+                return f"SELECT rowid FROM {self._table}_fts WHERE {colname} LIKE ?"
+            return f"SELECT * FROM {self._table} WHERE {colname} LIKE ?"
+        else:
+            raise BWErr(f"statement: unknown kind {kind}")
+
     # Utilities =====
 
     @staticmethod
@@ -304,6 +2288,14 @@ class BWDB:
     def make_dict_row(self, row):
         return dict(zip(self.column_names(), row))
 
+    def row_class(self):
+        """ Generated BWRow class for the current table """
+        return make_row_class(self.column_names())
+
+    def make_row(self, row):
+        """ Shape a plain row tuple as the table's BWRow class """
+        return self.row_class()(row)
+
     def have_db(self):
         if self._db is None:
             return False
@@ -317,41 +2309,142 @@ class BWDB:
             return True
 
     def have_table(self, table_name=None):
-        if table_name is None:
-            table_name = self._table
-        if table_name is None:
-            return False
-        if self._dbms == 'sqlite':
-            rc = self.sql_query_value("SELECT COUNT(*) FROM sqlite_master WHERE type=? AND name=?",
-                                      ('table', table_name))
-            if rc > 0:
-                return True
-        if self._dbms == 'mysql':
-            rc = self.sql_query_value("SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?",
-                                      (table_name,))
-            if rc > 0:
-                return True
-        return False
+        return self.table_info(table_name) is not None
 
     def lastrowid(self):
         return self._cur.lastrowid
 
     def begin_transaction(self):
         if self.have_db():
-            if self._database == 'sqlite':
-                self.sql_do("BEGIN TRANSACTION")
-            elif self._database == 'mysql':
-                self.sql_do("START TRANSACTION")
+            if self._dbms == 'sqlite':
+                if not self._db.in_transaction:
+                    self.sql_do_nocommit("BEGIN TRANSACTION")
+            elif self._dbms == 'mysql':
+                if not self._db.in_transaction:
+                    self._db.start_transaction()
+
+    @contextmanager
+    def transaction(self):
+        """
+            with db.transaction(): ... commits at the end, rolls back on exception.
+            Nested blocks use savepoints. commit() calls (e.g. from add_row) inside
+            the block are deferred to the end of the outermost block.
+        """
+        depth = self._tx_depth
+        savepoint = f"bwdb_sp{depth}"
+        if depth == 0:
+            self.flush()
+            self.begin_transaction()
+        else:
+            self._savepoint(f"SAVEPOINT {savepoint}")
+        self._tx_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._tx_depth = depth
+            if depth == 0:
+                self.rollback()
+            else:
+                self._savepoint(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                self._savepoint(f"RELEASE SAVEPOINT {savepoint}")
+            raise
+        self._tx_depth = depth
+        if depth == 0:
+            self._db.commit()
+        else:
+            self._savepoint(f"RELEASE SAVEPOINT {savepoint}")
+
+    def _savepoint(self, sql):
+        self._execute_plain(sql)    # savepoints can't be prepared statements on mysql
+
+    def group_commit(self, every=100, ms=50):
+        """
+            Share one real commit between up to every commit() calls or ms milliseconds,
+            whichever comes first. On sqlite opened with check_same_thread=False a timer
+            thread commits once ms have passed with nothing written since the last commit().
+            Otherwise (and on mysql, whose connections can't be shared between threads) the
+            ms limit is checked on the next commit() and flush() is up to the caller when
+            going idle. ms=None groups by count only.
+            disconnect() and detach() flush. rollback() also throws away the held-back
+            commits, so writes whose commit() already returned are lost with it.
+        """
+        self.flush()
+        self._group = (every, ms / 1000 if ms is not None else None)
+
+    def end_group_commit(self):
+        self.flush()
+        self._group = None
+
+    def flush(self):
+        """ Commit anything held back by group_commit() """
+        with self._group_lock:
+            self._cancel_group_timer()
+            if self._pending and self.have_db():
+                self._db.commit()
+            self._pending = 0
 
     def rollback(self):
-        if self.have_db():
-            self._db.rollback()
+        """ Roll back the open transaction, including commits held back by group_commit() """
+        with self._group_lock:
+            self._cancel_group_timer()
+            if self.have_db():
+                self._db.rollback()
+            self._pending = 0
+        if self._cache is not None:
+            self._cache.clear()     # may hold rows that were never committed
 
     def commit(self):
-        if self.have_db():
+        if not self.have_db() or self._tx_depth:
+            return
+        if self._group is None:
+            self._db.commit()
+            self._pending = 0
+            return
+        with self._group_lock:
+            every, seconds = self._group
+            now = time.monotonic()
+            self._dirty = False
+            if not self._pending:
+                self._pending_since = now
+                if seconds is not None and self._dbms == 'sqlite' and not self._check_same_thread:
+                    owner = self._group_owner()
+                    owner._group_timer = threading.Timer(seconds, self._group_timeout, (owner,))
+                    owner._group_timer.daemon = True
+                    owner._group_timer.start()
+            self._pending += 1
+            if self._pending < every and (seconds is None or now - self._pending_since < seconds):
+                return
+            self._cancel_group_timer()
             self._db.commit()
+            self._pending = 0
+
+    def _group_owner(self):
+        """ The object holding the connection and group commit state """
+        return self
+
+    def _cancel_group_timer(self):
+        owner = self._group_owner()
+        if owner._group_timer is not None:
+            owner._group_timer.cancel()
+            owner._group_timer = None
+
+    def _group_timeout(self, owner):
+        """ Timer thread: commit held back commit() calls, unless more was written since """
+        with self._group_lock:
+            owner._group_timer = None
+            if owner._pending and not owner._dirty and owner._db is not None:
+                try:
+                    owner._db.commit()
+                except sqlite3.Error:
+                    return      # e.g. busy, the next commit() tries again
+                owner._pending = 0
 
     def disconnect(self):
+        if self.have_db():
+            self.flush()
+            if self._in_memory and self._write_back:
+                self.save_snapshot()
+        self._close_reader()
         if self.have_cursor():
             self._cur.close()
         if self.have_db():
@@ -359,12 +2452,416 @@ class BWDB:
         self._cur = None
         self._db = None
         self._column_names = None
+        self._catalog = None
 
     # destructor
     def __del__(self):
         self.disconnect()
 
 
+class _BWThreadState:
+    """ One thread's connection and transaction state for ThreadLocalBWDB """
+
+    def __init__(self):
+        self._db = None
+        self._cur = None
+        self._read_db = None
+        self._read_cur = None
+        self._tx_depth = 0
+        self._pending = 0
+        self._pending_since = 0
+        self._dirty = False
+        self._group_timer = None
+        self._data_version = None
+
+    def close(self):
+        """ Commit anything held back by group_commit() and close the connections """
+        try:
+            if self._group_timer is not None:
+                self._group_timer.cancel()
+                self._group_timer = None
+            if self._pending and self._db is not None:
+                self._db.commit()
+        finally:
+            for conn in (self._read_cur, self._read_db, self._cur, self._db):
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._db = self._cur = self._read_db = self._read_cur = None
+            self._pending = 0
+            self._tx_depth = 0
+
+    # runs when the thread exits and threading.local drops the state
+    def __del__(self):
+        self.close()
+
+
+def _thread_attr(name, connect=False):
+    def fget(self):
+        if connect:     # connections and cursors open on first use in each thread
+            self._get_db()
+        return getattr(self._thread_state(), name)
+
+    def fset(self, value):
+        setattr(self._thread_state(), name, value)
+    return property(fget=fget, fset=fset)
+
+
+class ThreadLocalBWDB(BWDB):
+    """
+        BWDB where each thread transparently gets its own connection and cursor for the
+        same database, opened on first use and closed when the thread exits. Statements,
+        column names, the schema catalog, cache and timer are shared.
+        Create with BWDB(thread_local=True, ...) or ThreadLocalBWDB(...).
+    """
+
+    def __init__(self, **kwargs):
+        self._local = threading.local()
+        self._states = weakref.WeakSet()    # every live thread's state, for disconnect()
+        self._states_lock = threading.Lock()
+        self._connected = False
+        if kwargs.get('in_memory'):
+            raise BWErr('thread_local: can not be combined with in_memory')
+        if 'connection' in kwargs:
+            raise BWErr('thread_local: can not attach a connection')
+        # a thread's connection is closed by whichever thread drops the last reference
+        kwargs['check_same_thread'] = False
+        super().__init__(**kwargs)
+
+    def _thread_state(self):
+        try:
+            return self._local.state
+        except AttributeError:
+            state = _BWThreadState()
+            self._local.state = state
+            with self._states_lock:
+                self._states.add(state)
+            return state
+
+    def _get_db(self):
+        state = self._thread_state()
+        if state._db is None and self._connected:
+            state._db = self._connect()
+            state._data_version = None
+            self._connect_reader()
+            state._cur = self._new_cursor(state._db)
+            self._shape_connections(state._db, state._cur, state._read_db, state._read_cur)
+        return state._db
+
+    def _set_db(self, db):
+        self._thread_state()._db = db
+
+    _db = property(fget=_get_db, fset=_set_db)
+    _cur = _thread_attr('_cur', connect=True)
+    _read_db = _thread_attr('_read_db', connect=True)
+    _read_cur = _thread_attr('_read_cur', connect=True)
+    _tx_depth = _thread_attr('_tx_depth')
+    _pending = _thread_attr('_pending')
+    _pending_since = _thread_attr('_pending_since')
+    _dirty = _thread_attr('_dirty')
+    _group_timer = _thread_attr('_group_timer')
+    _data_version = _thread_attr('_data_version')
+
+    def set_database(self, database):
+        self._close_threads()
+        self._database = database
+        self._column_names = None
+        self._statements = {}
+        self._connected = True
+        self._get_db()      # open this thread's connection now so errors show up here
+
+    database = property(fget=BWDB.get_database, fset=set_database)
+
+    def _group_owner(self):
+        return self._thread_state()
+
+    def _set_row_factory(self):
+        with self._states_lock:
+            states = list(self._states)
+        for state in states:
+            self._shape_connections(state._db, state._cur, state._read_db, state._read_cur)
+
+    def attach(self, connection, database):
+        raise BWErr('attach: not supported with thread_local')
+
+    def detach(self):
+        raise BWErr('detach: not supported with thread_local')
+
+    def _close_threads(self):
+        with self._states_lock:
+            states = list(self._states)
+        for state in states:
+            state.close()
+
+    def disconnect(self):
+        """ Close every thread's connection """
+        self._connected = False
+        self._close_threads()
+        self._column_names = None
+        self._catalog = None
+
+
+class BWDBPool:
+    """ Keep warm connections for BWDB, keyed by dbms/database/host/user """
+
+    def __init__(self, max_size=5, idle_timeout=300, wait_timeout=30):
+        self.max_size = max_size            # open connections per key
+        self.idle_timeout = idle_timeout    # seconds before an idle connection is closed
+        self.wait_timeout = wait_timeout    # seconds to wait for a free connection
+        self._idle = {}                     # key -> [(connection, last_used), ...]
+        self._open = {}                     # key -> number of open connections
+        self._lock = threading.Condition()
+
+    @staticmethod
+    def make_key(**kwargs):
+        return (kwargs.get('dbms'), kwargs.get('database'), kwargs.get('host'), kwargs.get('user'))
+
+    @contextmanager
+    def connection(self, **kwargs):
+        """ Lend out a ready BWDB, use as: with pool.connection(dbms=..., database=...) as db """
+        db = self.checkout(**kwargs)
+        try:
+            yield db
+        finally:
+            self.checkin(db)
+
+    def checkout(self, **kwargs):
+        """ Return a BWDB on a pooled connection, must be returned with checkin() """
+        key = self.make_key(**kwargs)
+        table = kwargs.pop('table', None)
+        conn = self._get_connection(key, kwargs)
+        try:
+            db = BWDB(connection=conn, check_same_thread=False, **kwargs)
+            if table is not None:
+                db.table = table
+        except BaseException:
+            self._discard(key, conn)
+            raise
+        db._pool_key = key
+        return db
+
+    def checkin(self, db):
+        """ Return a BWDB's connection to the pool """
+        key = db._pool_key
+        if key is None:
+            raise BWErr("checkin: BWDB did not come from a pool")
+        db._pool_key = None
+        conn = db.detach()
+        if conn is None:    # disconnected while checked out
+            self._discard(key, None)
+            return
+        try:
+            if getattr(conn, 'in_transaction', True):
+                conn.rollback()     # don't leak uncommitted work to the next user
+        except Exception:
+            self._discard(key, conn)
+            return
+        with self._lock:
+            self._idle.setdefault(key, []).append((conn, time.monotonic()))
+            self._lock.notify()
+
+    def _get_connection(self, key, kwargs):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._lock:
+            while True:
+                self._expire(key)
+                idle = self._idle.get(key)
+                if idle:
+                    conn = idle.pop()[0]
+                    break
+                if self._open.get(key, 0) < self.max_size:
+                    self._open[key] = self._open.get(key, 0) + 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise BWErr("BWDBPool: timed out waiting for a connection")
+                self._lock.wait(remaining)
+
+        if conn is not None:
+            if self._healthy(conn):
+                return conn
+            self._discard(key, conn)
+            with self._lock:
+                self._open[key] = self._open.get(key, 0) + 1
+
+        # open outside the lock, the mysql handshake can be slow
+        try:
+            return BWDB(check_same_thread=False, **kwargs).detach()
+        except BaseException:
+            self._discard(key, None)
+            raise
+
+    def _expire(self, key):
+        """ Close connections idle longer than idle_timeout (lock must be held) """
+        idle = self._idle.get(key)
+        if not idle:
+            return
+        cutoff = time.monotonic() - self.idle_timeout
+        keep = []
+        for conn, last_used in idle:
+            if last_used < cutoff:
+                self._close(conn)
+                self._open[key] -= 1
+            else:
+                keep.append((conn, last_used))
+        self._idle[key] = keep
+
+    @staticmethod
+    def _healthy(conn):
+        try:
+            if have_mysql and hasattr(conn, 'ping'):
+                conn.ping(reconnect=False)
+            else:
+                conn.execute("SELECT 1").fetchall()
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, key, conn):
+        if conn is not None:
+            self._close(conn)
+        with self._lock:
+            self._open[key] = self._open.get(key, 1) - 1
+            self._lock.notify()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """ Close all idle connections """
+        with self._lock:
+            for key, idle in self._idle.items():
+                for conn, last_used in idle:
+                    self._close(conn)
+                self._open[key] -= len(idle)
+            self._idle = {}
+
+
+class AsyncBWDB:
+    """ asyncio front-end for BWDB, each executor worker owns its own connection """
+
+    def __init__(self, max_workers=4, max_inflight=None, max_streams=None, **kwargs):
+        self._kwargs = kwargs
+        self._local = threading.local()
+        self._workers = []
+        self._workers_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='AsyncBWDB')
+        self._inflight = asyncio.Semaphore(max_inflight or max_workers * 4)
+        # sql_query() streams hold a worker of their own from open to close
+        max_streams = max_streams or max_workers
+        self._stream_executor = ThreadPoolExecutor(max_workers=max_streams,
+                                                   thread_name_prefix='AsyncBWDB-stream')
+        self._streams = asyncio.Semaphore(max_streams)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def _worker_db(self):
+        """ BWDB for the current worker thread, created on first use """
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            # closed from the event loop thread in close()
+            db = BWDB(check_same_thread=False, **self._kwargs)
+            self._local.db = db
+            with self._workers_lock:
+                self._workers.append(db)
+        return db
+
+    def _call(self, method, args):
+        return getattr(self._worker_db(), method)(*args)
+
+    async def run(self, method, *args):
+        """ Run any BWDB method on a worker, e.g. await adb.run('count_rows') """
+        async with self._inflight:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(self._call, method, args))
+
+    async def sql_do(self, sql, parms=()):
+        return await self.run('sql_do', sql, parms)
+
+    async def sql_query_row(self, sql, parms=()):
+        return await self.run('sql_query_row', sql, parms)
+
+    async def sql_query_value(self, sql, parms=()):
+        return await self.run('sql_query_value', sql, parms)
+
+    async def get_row(self, row_id):
+        return await self.run('get_row', row_id)
+
+    async def add_row(self, parms=()):
+        return await self.run('add_row', parms)
+
+    async def update_row(self, row_id, dict_rec):
+        return await self.run('update_row', row_id, dict(dict_rec))
+
+    async def del_row(self, row_id):
+        return await self.run('del_row', row_id)
+
+    async def sql_query(self, sql, parms=(), arraysize=None):
+        """
+            Async iterator over query rows, fetched in batches on a stream worker (up to
+            max_streams open at once, more wait for one to close), so awaiting point
+            calls (get_row etc.) inside the loop can't starve the worker pool
+        """
+        async with self._streams:
+            loop = asyncio.get_running_loop()
+            queue = asyncio.Queue(maxsize=2)
+            stop = threading.Event()
+            future = loop.run_in_executor(self._stream_executor, self._produce,
+                                          sql, parms, arraysize, loop, queue, stop)
+            try:
+                while True:
+                    batch = await queue.get()
+                    if batch is None:
+                        break
+                    for row in batch:
+                        yield row
+            finally:
+                # unblock the producer if the consumer stopped early
+                stop.set()
+                while not future.done():
+                    while not queue.empty():
+                        queue.get_nowait()
+                    await asyncio.wait((future,), timeout=0.01)
+            future.result()
+
+    def _produce(self, sql, parms, arraysize, loop, queue, stop):
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        try:
+            batches = self._worker_db().sql_query_batches(sql, parms, arraysize)
+            try:
+                for batch in batches:
+                    if stop.is_set():
+                        break
+                    put(batch)
+            finally:
+                batches.close()     # done with the cursor before this worker's next stream
+        finally:
+            put(None)
+
+    async def close(self):
+        """ Shut down the executors and close the worker connections """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown)
+        await loop.run_in_executor(None, self._stream_executor.shutdown)
+        with self._workers_lock:
+            for db in self._workers:
+                db.disconnect()
+            self._workers = []
+
+
 MY_HOST = 'pluto.local'
 MY_USER = 'appuser'
 MY_PASS = 'Spartacus'
@@ -442,8 +2939,9 @@ def main():
         print("find more than one row (%s%)")
         row_ids = db.find_rows("name", "%s%")
         print(f"found {len(row_ids)} rows")
+        rows = db.get_rows_by_ids(row_ids)
         for row_id in row_ids:
-            print(db.get_row(row_id))
+            print(rows[row_id])
 
         print()
         print("search for %Bird%")
@@ -481,30 +2979,23 @@ def main():
         # add more rows to test paging
         print()
         print("add more rows")
-        db.begin_transaction()
-        for row in insert_rows:
-            numrows = db.add_row_nocommit(row)
-        for row in insert_rows:
-            numrows += db.add_row_nocommit(row)
-        for row in insert_rows:
-            numrows += db.add_row_nocommit(row)
-        db.commit()
+        numrows = db.add_rows(insert_rows * 3, chunk_size=8)
         print(f"added {numrows} rows")
 
         print()
         print("page through rows")
-        offset = 0
-        limit = 5
+        token = None
         while True:
-            count = 0
-            for row in db.get_rows_limit(limit, offset):
+            rows, token = db.get_rows_after(token, 5)
+            for row in rows:
                 print(row)
-                count += 1
-            if count == 0:  # no rows left
+            print("=====")
+            if token is None:  # no rows left
                 break
-            else:
-                print("=====")
-                offset += 5
+
+        print()
+        print("async stream with nested awaits (one worker)")
+        asyncio.run(async_demo(db.database))
 
         print()
         print("change table to item")
@@ -535,5 +3026,62 @@ def main():
         exit(1)
 
 
+async def async_demo(database):
+    async with AsyncBWDB(max_workers=1, dbms='sqlite', database=database, table='temp') as adb:
+        count = 0
+        async for row in adb.sql_query("SELECT * FROM temp"):
+            await adb.get_row(row[0])   # needs the worker while the stream is open
+            count += 1
+        print(f"streamed {count} rows")
+
+
+def audit_main(args):
+    """ python3 BWDB.py audit database.db [table ...] """
+    if not args:
+        print("usage: BWDB.py audit database.db [table ...]")
+        exit(2)
+    try:
+        db = BWDB(dbms='sqlite', database=args[0])
+        audit = db.enable_audit()
+        tables = args[1:] or [info['name'] for info in db.schema().tables.values()]
+        for table in tables:
+            info = db.table_info(table)
+            if info is None or not info['columns'] or info['columns'][0] != 'id':
+                print(f"skipping {table}: no id column")
+                continue
+            db.table = table
+            for kind in ('get', 'get_limit', 'del', 'first', 'after', 'before'):
+                db.statement(kind, 'id' if kind in ('first', 'after', 'before') else None)
+            for colname in db.column_names()[1:]:
+                db.statement('find', colname)
+        print(f"audited {len(audit.plans)} statements")
+        audit.print_report()
+    except BWErr as err:
+        print(f"Error: {err}")
+        exit(1)
+
+
+def load_main(args):
+    """ python3 BWDB.py load database.db dump.sql [...] """
+    if len(args) < 2:
+        print("usage: BWDB.py load database.db dump.sql [...]")
+        exit(2)
+    try:
+        db = BWDB(dbms='sqlite', database=args[0], profile='bulk_load')
+        for path in args[1:]:
+            start = time.perf_counter()
+            statements, rows = db.load_sql(path)
+            print(f"{path}: {statements} statements, {rows} rows in {time.perf_counter() - start:.2f}s")
+        db.disconnect()
+    except (BWErr, sqlite3.Error, OSError) as err:
+        print(f"Error: {err}")
+        exit(1)
+
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == 'audit':
+        audit_main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'load':
+        load_main(sys.argv[2:])
+    else:
+        main()
@@ -25,7 +25,7 @@ Gvars = dict(
     config=ConfigFile('./jurl/db.conf').recs(),
     tpl=TplFile(None, showUnknowns=True),
     cgi=BWCGI(),
-    db=BWDB(dbms='sqlite', database='./data/jurl.db'),
+    db=BWDB(dbms='sqlite', database='./data/jurl.db', profile='read_heavy'),
     stacks=dict(
         messages=[],
         errors=[],
@@ -71,6 +71,11 @@ def init():
             error("invalid dbms")
         db.sql_do(create_sql)
     db.table = Gvars['table_name']
+    db.dict_rows = True
+
+    # keep count_rows() O(1) for the pager
+    if not db.have_row_counter():
+        db.enable_row_counter()
 
 
 def dispatch():
@@ -136,44 +141,47 @@ def listrecs():
     if count % int(sql_limit):
         numpages += 1
 
-    # what page is this?
+    # what page is this? (keyset paging on id, see BWDB.get_rows_after)
     curpage = 0
-    if 'jumppage' in v:
-        curpage = int(v.getfirst('jumppage'))
-    elif 'nextpage' in v:
+    if 'nextpage' in v:
         curpage = int(v.getfirst('pageno')) + 1
+        rows, _ = db.get_rows_after(int(v.getfirst('after')), sql_limit)
     elif 'prevpage' in v:
-        curpage = int(v.getfirst('pageno')) - 1
+        curpage = max(int(v.getfirst('pageno')) - 1, 0)
+        rows, _ = db.get_rows_before(int(v.getfirst('before')), sql_limit)
+    else:
+        rows, _ = db.get_rows_after(None, sql_limit)
 
-    pagebar = list_pagebar(curpage, numpages)
+    if rows:
+        pagebar = list_pagebar(curpage, numpages, rows[0][0], rows[-1][0])
+    else:
+        pagebar = list_pagebar(curpage, numpages, None, None)
 
     a = ''
-    for r in db.get_rows_limit(sql_limit, curpage * sql_limit):
-        dict_r = db.make_dict_row(r)
-        set_form_vars(**dict_r)
+    for r in rows:
+        set_form_vars(**r)
         a += getpage('recline')
 
     set_form_vars()
     var('CONTENT', pagebar + a + pagebar)
 
 
-def list_pagebar(pageno, numpages):
+def list_pagebar(pageno, numpages, first_id, last_id):
     """ return the html for the pager line """
     prevlink = '<span class="n">&lt;&lt;</span>'
     nextlink = '<span class="n">&gt;&gt;</span>'
     linkback = Gvars['linkback']
 
+    if pageno > 0 and first_id is not None:
+        prevlink = f'<a href="{linkback}?pageno={pageno}&before={first_id}&prevpage=1">&lt;&lt;</a>'
+    if pageno < (numpages - 1) and last_id is not None:
+        nextlink = f'<a href="{linkback}?pageno={pageno}&after={last_id}&nextpage=1">&gt;&gt;</a>'
+
     if pageno > 0:
-        prevlink = f'<a href="{linkback}?pageno={pageno}&prevpage=1">&lt;&lt;</a>'
-    if pageno < (numpages - 1):
-        nextlink = f'<a href="{linkback}?pageno={pageno}&nextpage=1">&gt;&gt;</a>'
-
-    pagebar = ''
-    for n in range(0, numpages):
-        if n is pageno:
-            pagebar += f'<span class="n">{n + 1}</span>'
-        else:
-            pagebar += f'<a href="{linkback}?jumppage={n}">{n+1}</a>'
+        pagebar = f'<a href="{linkback}">1</a>'
+    else:
+        pagebar = ''
+    pagebar += f'<span class="n">{pageno + 1} of {numpages}</span>'
 
     var('prevlink', prevlink)
     var('nextlink', nextlink)
@@ -23,7 +23,7 @@ default_url = 'https://bw.org/error'
 
 def main():
     config = ConfigFile(g['config_file']).recs()
-    db = BWDB(dbms='sqlite', database=config['db'], table=g['table_name'])
+    db = BWDB(dbms='sqlite', database=config['db'], table=g['table_name'], profile='read_heavy')
     cgi = BWCGI()
     cgi_vars = cgi.vars()
 
@@ -3,7 +3,7 @@
 # simple python web server
 # as of 2021-04-07 bw
 
-from http.server import HTTPServer, CGIHTTPRequestHandler
+from http.server import ThreadingHTTPServer, CGIHTTPRequestHandler
 
 
 class Handler(CGIHTTPRequestHandler):
@@ -12,6 +12,6 @@ class Handler(CGIHTTPRequestHandler):
 
 PORT = 9999
 
-httpd = HTTPServer(("", PORT), Handler)
+httpd = ThreadingHTTPServer(("", PORT), Handler)
 print("serving at port", PORT)
 httpd.serve_forever()
@@ -4099,7 +4099,7 @@ INSERT INTO City VALUES (4076,'Hebron','PSE','Hebron',119401);
 INSERT INTO City VALUES (4077,'Jabaliya','PSE','North Gaza',113901);
 INSERT INTO City VALUES (4078,'Nablus','PSE','Nablus',100231);
 INSERT INTO City VALUES (4079,'Rafah','PSE','Rafah',92020);
-COMMIT
+COMMIT;
 
 --
 -- Table structure for table Country
@@ -4128,7 +4128,7 @@ CREATE TABLE Country (
 -- Dumping data for table Country
 --
 
-BEGIN
+BEGIN;
 INSERT INTO Country VALUES ('AFG','Afghanistan','Asia','Southern and Central Asia',652090.00,1919,22720000,45.9,5976.00,NULL,'Afganistan/Afqanestan','Islamic Emirate','Mohammad Omar',1,'AF');
 INSERT INTO Country VALUES ('NLD','Netherlands','Europe','Western Europe',41526.00,1581,15864000,78.3,371362.00,360478.00,'Nederland','Constitutional Monarchy','Beatrix',5,'NL');
 INSERT INTO Country VALUES ('ANT','Netherlands Antilles','North America','Caribbean',800.00,NULL,217000,74.7,1941.00,NULL,'Nederlandse Antillen','Nonmetropolitan Territory of The Netherlands','Beatrix',33,'AN');
@@ -4368,7 +4368,7 @@ INSERT INTO Country VALUES ('SGS','South Georgia and the South Sandwich Islands'
 INSERT INTO Country VALUES ('HMD','Heard Island and McDonald Islands','Antarctica','Antarctica',359.00,NULL,0,NULL,0.00,NULL,'Heard and McDonald Islands','Territory of Australia','Elisabeth II',NULL,'HM');
 INSERT INTO Country VALUES ('ATF','French Southern territories','Antarctica','Antarctica',7780.00,NULL,0,NULL,0.00,NULL,'Terres australes françaises','Nonmetropolitan Territory of France','Jacques Chirac',NULL,'TF');
 INSERT INTO Country VALUES ('UMI','United States Minor Outlying Islands','Oceania','Micronesia/Caribbean',16.00,NULL,0,NULL,0.00,NULL,'United States Minor Outlying Islands','Dependent Territory of the US','George W. Bush',NULL,'UM');
-COMMIT
+COMMIT;
 
 --
 -- Table structure for table CountryLanguage
@@ -4387,7 +4387,7 @@ CREATE TABLE CountryLanguage (
 -- Dumping data for table CountryLanguage
 --
 
-BEGIN
+BEGIN;
 INSERT INTO CountryLanguage VALUES ('AFG','Pashto',1,52.4);
 INSERT INTO CountryLanguage VALUES ('NLD','Dutch',1,95.6);
 INSERT INTO CountryLanguage VALUES ('ANT','Papiamento',1,86.2);
@@ -5372,4 +5372,4 @@ INSERT INTO CountryLanguage VALUES ('CAN','Eskimo Languages',0,0.1);
 INSERT INTO CountryLanguage VALUES ('CHN','Dong',0,0.2);
 INSERT INTO CountryLanguage VALUES ('RUS','Belorussian',0,0.3);
 INSERT INTO CountryLanguage VALUES ('USA','Portuguese',0,0.2);
-COMMIT
+COMMIT;